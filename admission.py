@@ -0,0 +1,169 @@
+# admission.py
+# Control de admisión delante de la base de datos (middleware ASGI):
+#  - Concurrencia: como mucho ADMISSION_MAX_CONCURRENT peticiones a la vez llegan a los routers;
+#    hasta ADMISSION_QUEUE esperan turno como mucho ADMISSION_QUEUE_TIMEOUT segundos. El resto se
+#    rechaza en el acto con 503 + Retry-After, en lugar de abrir más conexiones (con NullPool,
+#    cada petición es una conexión nueva a Postgres) y hacer lenta la API para todos.
+#  - Rate limit por cliente (token bucket): RATE_LIMIT_RPS peticiones/s con ráfagas de hasta
+#    RATE_LIMIT_BURST; el exceso recibe 429 + Retry-After. RATE_LIMIT_RPS=0 (por defecto) lo
+#    desactiva, y ADMISSION_MAX_CONCURRENT=0 desactiva el límite de concurrencia.
+# Health, métricas y documentación no pasan por aquí.
+from __future__ import annotations
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "64"))
+QUEUE = int(os.getenv("ADMISSION_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "0"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "20"))
+# proxies propios delante de la app (Render = 1); cada uno añade una IP al final de X-Forwarded-For
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "1"))
+
+EXENTAS = ("/health", "/metrics", "/docs", "/redoc", "/openapi.json")
+SATURADO = "Servidor saturado, reintenta en unos segundos"
+
+class TokenBuckets:
+    """Un bucket por cliente; se guardan como mucho `max_clientes` (LRU) para no crecer sin límite."""
+    def __init__(self, rate: float, burst: int, max_clientes: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clientes = max_clientes
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # cliente -> (tokens, t)
+
+    def tomar(self, cliente: str) -> float:
+        """0 si se admite; si no, segundos hasta que haya un token."""
+        ahora = time.monotonic()
+        tokens, t = self._buckets.pop(cliente, (float(self.burst), ahora))
+        tokens = min(self.burst, tokens + (ahora - t) * self.rate)
+        espera = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            espera = (1 - tokens) / self.rate
+        self._buckets[cliente] = (tokens, ahora)
+        if len(self._buckets) > self.max_clientes:
+            self._buckets.popitem(last=False)
+        return espera
+
+class AdmissionControl:
+    """Estado compartido del control de admisión (cupos, cola y contadores)."""
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT,
+        queue: int = QUEUE,
+        queue_timeout: float = QUEUE_TIMEOUT,
+        rate: float = RATE_LIMIT_RPS,
+        burst: int = RATE_LIMIT_BURST,
+    ):
+        self.max_concurrent = max_concurrent
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self.buckets = TokenBuckets(rate, burst) if rate > 0 else None
+        self._sem = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+        self.activos = 0
+        self.esperando = 0
+        self.admitidas = 0
+        self.rechazadas_429 = 0
+        self.rechazadas_503 = 0
+
+    async def entrar(self, cliente: str) -> Optional[Tuple[int, str, float]]:
+        """None si se admite (llamar luego a salir()); si no, (status, detalle, retry_after)."""
+        if self.buckets is not None:
+            espera = self.buckets.tomar(cliente)
+            if espera > 0:
+                self.rechazadas_429 += 1
+                return 429, "Demasiadas peticiones", espera
+
+        if self._sem is not None:
+            if self._sem.locked():
+                # sin cupo: cola corta, y si también está llena se rechaza sin esperar
+                if self.esperando >= self.queue:
+                    self.rechazadas_503 += 1
+                    return 503, SATURADO, 1
+                self.esperando += 1
+                adquirido = False
+                try:
+                    async with asyncio.timeout(self.queue_timeout):
+                        await self._sem.acquire()
+                        adquirido = True
+                except TimeoutError:
+                    if adquirido:  # el plazo venció justo después de obtener el cupo: devolverlo
+                        self._sem.release()
+                    self.rechazadas_503 += 1
+                    return 503, SATURADO, 1
+                finally:
+                    self.esperando -= 1
+            else:
+                await self._sem.acquire()
+
+        self.activos += 1
+        self.admitidas += 1
+        return None
+
+    def salir(self) -> None:
+        self.activos -= 1
+        if self._sem is not None:
+            self._sem.release()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "activos": self.activos,
+            "esperando": self.esperando,
+            "admitidas": self.admitidas,
+            "rechazadas_429": self.rechazadas_429,
+            "rechazadas_503": self.rechazadas_503,
+        }
+
+admission_control = AdmissionControl()
+
+class AdmissionMiddleware:
+    def __init__(self, app, control: AdmissionControl = admission_control):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/" or scope["path"].startswith(EXENTAS):
+            return await self.app(scope, receive, send)
+
+        rechazo = await self.control.entrar(_cliente(scope))
+        if rechazo is not None:
+            return await _rechazar(send, *rechazo)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.control.salir()
+
+def _cliente(scope) -> str:
+    # X-Forwarded-For lo puede escribir el cliente; solo son fiables las entradas que añadieron
+    # nuestros TRUSTED_PROXIES, así que la IP real es la N-ésima desde la derecha
+    if TRUSTED_PROXIES > 0:
+        ips = [
+            ip.strip()
+            for k, v in scope.get("headers", ())
+            if k == b"x-forwarded-for"
+            for ip in v.decode("latin-1").split(",")
+        ]
+        if len(ips) >= TRUSTED_PROXIES:
+            return ips[-TRUSTED_PROXIES]
+    client: Optional[tuple] = scope.get("client")
+    return client[0] if client else "desconocido"
+
+async def _rechazar(send, status: int, detail: str, retry_after: float) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
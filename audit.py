@@ -0,0 +1,247 @@
+# audit.py
+# Historial de eliminados con escritura diferida (write-behind).
+# Los handlers encolan el registro después de su commit y responden sin esperar el INSERT;
+# una tarea de fondo agrupa la cola en INSERTs multi-fila. La cola es acotada: si se llena,
+# log_delete espera (backpressure) en lugar de crecer sin límite. Al apagar se vacía la cola.
+# Lo que no se puede escribir (lote que falla 3 veces, o cola pendiente al apagar si el escritor
+# murió o no termina en AUDIT_CLOSE_TIMEOUT) va a AUDIT_FALLBACK_LOG en JSON Lines, y se
+# recupera con:
+#     python audit.py replay
+from __future__ import annotations
+import asyncio
+import json
+import os
+import sys
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import delete, insert, inspect, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import ONETOMANY
+
+from database import AsyncSessionLocal
+from models import HistorialEliminados
+
+AUDIT_FALLBACK_LOG = os.getenv("AUDIT_FALLBACK_LOG", "historial_pendiente.jsonl")
+
+def _append_fallback(path: str, batch: List[Dict[str, Any]]) -> None:
+    with open(path, "a", encoding="utf-8") as f:
+        for row in batch:
+            f.write(json.dumps(row, default=_json_safe, ensure_ascii=False) + "\n")
+
+class AuditQueue:
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        close_timeout: float = 10.0,
+        fallback_log: str = AUDIT_FALLBACK_LOG,
+    ):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.close_timeout = close_timeout
+        self.fallback_log = fallback_log
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lote: Optional[List[Dict[str, Any]]] = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.fallback = 0
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._task = asyncio.create_task(self._run(), name="audit-writer")
+
+    async def put(self, row: Dict[str, Any]) -> None:
+        self.start()
+        await self._queue.put(row)  # bloquea si la cola está llena
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                # _lote: lo que el escritor ya sacó de la cola y todavía no está en la BD ni en el
+                # log de respaldo; si close() cancela la tarea a mitad de camino, va al respaldo
+                self._lote = [await self._queue.get()]
+                # junta lo que llegue durante flush_interval, hasta batch_size
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + self.flush_interval
+                while len(self._lote) < self.batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        self._lote.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                await self._write(self._lote)
+        except asyncio.CancelledError:
+            if self._lote:
+                self._guardar(self._lote)  # síncrono: la tarea ya está cancelada
+                for _ in self._lote:
+                    self._queue.task_done()
+                self._lote = None
+            raise
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        for intento in range(3):
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(HistorialEliminados), batch)
+                    await db.commit()
+                    self._lote = None  # ya está en la BD
+                self.written += len(batch)
+                self.batches += 1
+                break
+            except Exception as e:
+                if intento == 2:
+                    print(f"⚠ Historial: {len(batch)} registros no se pudieron escribir tras 3 intentos: {e}")
+                    self._lote = None  # el hilo escribe el respaldo aunque la tarea se cancele
+                    await self._to_fallback(batch)
+                else:
+                    await asyncio.sleep(0.5 * (intento + 1))
+        for _ in batch:
+            self._queue.task_done()
+
+    def _guardar(self, batch: List[Dict[str, Any]]) -> None:
+        try:
+            _append_fallback(self.fallback_log, batch)
+            self.fallback += len(batch)
+            print(f"  {len(batch)} registros guardados en {self.fallback_log} (python audit.py replay)")
+        except OSError as e:
+            self.dropped += len(batch)
+            print(f"⚠ Historial: se descartan {len(batch)} registros, no se pudo escribir {self.fallback_log}: {e}")
+
+    async def _to_fallback(self, batch: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._guardar, batch)
+
+    async def close(self) -> None:
+        """Escribe lo pendiente y detiene la tarea de fondo (llamar al apagar la app)."""
+        if self._task is None:
+            return
+        if not self._task.done():
+            try:
+                await asyncio.wait_for(self._queue.join(), self.close_timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠ Historial: la cola no se vació en {self.close_timeout:.0f}s")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"⚠ Historial: el escritor había terminado con error: {e}")
+        self._task = None
+        # el escritor murió o no llegó a tiempo: lo que quede en la cola va al log de respaldo
+        pendientes = []
+        while not self._queue.empty():
+            pendientes.append(self._queue.get_nowait())
+            self._queue.task_done()
+        if pendientes:
+            await self._to_fallback(pendientes)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self._queue.qsize() if self._queue else 0,
+            "maxsize": self.maxsize,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "fallback": self.fallback,
+        }
+
+audit_queue = AuditQueue(
+    maxsize=int(os.getenv("AUDIT_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("AUDIT_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5")),
+    close_timeout=float(os.getenv("AUDIT_CLOSE_TIMEOUT", "10")),
+)
+
+SNAPSHOT_EXCLUIR = {"contraseña"}  # nunca se copia al historial
+
+async def log_delete(tabla: str, registro_id: int, descripcion: str | None = None, registro: dict | None = None):
+    """Encola el registro de historial; llamar después del commit del DELETE."""
+    now = datetime.now(timezone.utc)
+    datos = {"descripcion": descripcion or "", "timestamp": now.isoformat()}
+    if registro is not None:
+        datos["registro"] = registro
+    await audit_queue.put({
+        "tabla": tabla,
+        "registro_id": registro_id,
+        "datos": datos,
+        "eliminado_en": now,
+    })
+
+# -----------------------------
+# DELETE ... RETURNING con snapshot
+# -----------------------------
+def _json_safe(v: Any) -> Any:
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return str(v)
+    return v
+
+def snapshot(model, row: Row) -> dict:
+    """Fila completa devuelta por RETURNING como dict serializable a JSONB."""
+    m = row._mapping
+    return {c.name: _json_safe(m[c]) for c in model.__table__.c if c.name not in SNAPSHOT_EXCLUIR}
+
+async def delete_returning(db: AsyncSession, model, ids: Sequence[int], *extra) -> List[Row]:
+    """
+    Borra las filas `ids` y las devuelve completas (más las expresiones `extra`) en la misma
+    sentencia. Antes pone a NULL las FKs de los hijos, igual que hacía session.delete() con las
+    relaciones one-to-many sin cascade. No hace commit.
+    """
+    if not ids:
+        return []
+    for rel in inspect(model).relationships:
+        if rel.direction is ONETOMANY:
+            for _, remote in rel.local_remote_pairs:
+                await db.execute(update(remote.table).where(remote.in_(ids)).values({remote.name: None}))
+    res = await db.execute(
+        delete(model.__table__).where(model.__table__.c.id.in_(ids)).returning(*model.__table__.c, *extra)
+    )
+    return res.all()
+
+async def log_deleted_rows(tabla: str, model, rows: Iterable[Row], describir: Callable[[Row], str]) -> None:
+    """Encola una entrada de historial con snapshot por cada fila borrada (después del commit)."""
+    for row in rows:
+        await log_delete(tabla, row.id, describir(row), snapshot(model, row))
+
+# -----------------------------
+# Recuperación del log de respaldo
+# -----------------------------
+async def replay(path: str = AUDIT_FALLBACK_LOG) -> int:
+    """Inserta en historial_eliminados las filas del log de respaldo y lo renombra a *.hecho."""
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        filas = [json.loads(line) for line in f if line.strip()]
+    for fila in filas:
+        fila["eliminado_en"] = datetime.fromisoformat(fila["eliminado_en"])
+    async with AsyncSessionLocal() as db:
+        for start in range(0, len(filas), 500):
+            await db.execute(insert(HistorialEliminados), filas[start:start + 500])
+        await db.commit()
+    os.replace(path, path + ".hecho")
+    return len(filas)
+
+async def _main(argv: List[str]) -> None:
+    from database import dispose_engine
+
+    if argv[1:] != ["replay"]:
+        print("uso: python audit.py replay")
+        sys.exit(2)
+    n = await replay()
+    await dispose_engine()
+    print(f"✔ historial recuperado del log de respaldo: {n} registros")
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv))
@@ -0,0 +1,597 @@
+# benchmark.py
+# Benchmark reproducible de toda la API (main.app) contra una base local.
+#
+#   python benchmark.py [--db URL] [--productos 100000] [--compras 1000000]
+#                       [--concurrencia 32] [--peticiones 1000] [--solo productos,compras]
+#                       [--salida bench_results/x.json] [--comparar bench_results/anterior.json]
+#
+# Sin --db se crea un SQLite (aiosqlite) en un archivo temporal. Con una URL de PostgreSQL local
+# (DB_SSL=0 si no usa SSL) se crean las tablas y se siembran datos: usar una base desechable.
+# Si la base ya tiene productos no se vuelve a sembrar (útil para repetir corridas).
+#
+# La app corre en el mismo proceso vía httpx.ASGITransport (sin red ni uvicorn), con su startup
+# y shutdown, y cada escenario se ejecuta con N clientes concurrentes. Por endpoint se reporta
+# throughput y latencia p50/p95/p99; el resultado queda en JSON (con commit y variables de entorno)
+# para comparar entre commits con --comparar.
+#
+# La configuración de la app se toma del entorno como en producción, así se comparan modos:
+#     DB_POOL_MODE=null  python benchmark.py --salida null.json
+#     DB_POOL_MODE=queue python benchmark.py --salida queue.json --comparar null.json
+#     FAST_JSON_LISTS=1  python benchmark.py --solo listados --comparar queue.json
+#
+# --arranque N mide además el arranque en frío de main.app (import + lifespan + primera petición)
+# en N procesos nuevos; con --solo arranque solo se mide eso: se crean las tablas que falten pero
+# no se siembra ni se corren escenarios (N=5 si no se indica --arranque).
+from __future__ import annotations
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+
+SEMILLA = 42
+LOTE = 10000
+ENV_REPORTADAS = (
+    "DB_POOL_MODE", "DB_POOL_SIZE", "DB_MAX_OVERFLOW", "DB_POOL_PRE_PING",
+    "FAST_JSON_LISTS", "CATALOG_CACHE_SIZE", "CATALOG_CACHE_TTL", "AUDIT_BATCH_SIZE",
+    "ADMISSION_MAX_CONCURRENT", "ADMISSION_QUEUE", "ADMISSION_QUEUE_TIMEOUT", "RATE_LIMIT_RPS", "RATE_LIMIT_BURST",
+)
+
+PALABRAS = (
+    "cuaderno lapiz borrador regla tijeras pegante marcador resaltador carpeta folder cartulina "
+    "colores crayones temperas pincel compas transportador calculadora agenda libreta sacapuntas "
+    "cinta grapadora clips corrector esfero portaminas block papel silicona plastilina"
+).split()
+ADJETIVOS = "rayado cuadriculado azul rojo negro grande pequeño doble escolar profesional".split()
+
+# -----------------------------
+# Siembra de datos
+# -----------------------------
+async def sembrar(engine, n_productos: int, n_compras: int) -> None:
+    from sqlalchemy import func, insert, select, text
+
+    from database import Base
+    from models import Categoria, Cliente, Compra, HistorialEliminados, Producto, Usuario
+
+    async with engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            await conn.execute(text("PRAGMA journal_mode=WAL"))  # lectores no bloquean al escritor
+        await conn.run_sync(Base.metadata.create_all)
+        if (await conn.execute(select(func.count()).select_from(Producto))).scalar():
+            print("• la base ya tiene datos, no se siembra")
+            return
+
+    rng = random.Random(SEMILLA)
+    ahora = datetime.now(timezone.utc)
+    n_categorias, n_usuarios, n_clientes = 200, 1000, 10000
+    t0 = time.perf_counter()
+
+    async def cargar(model, filas):
+        async with engine.begin() as conn:
+            for start in range(0, len(filas), LOTE):
+                await conn.execute(insert(model), filas[start:start + LOTE])
+
+    await cargar(Categoria, [
+        {"nombre": f"Categoría {i}", "codigo": f"CAT-{i:04d}", "actualizado_en": ahora}
+        for i in range(1, n_categorias + 1)
+    ])
+    await cargar(Usuario, [
+        {"nombre": f"Usuario {i}", "correo": f"usuario{i}@example.com", "contraseña": "x" * 12,
+         "rol": "administrador" if i % 50 == 0 else "cliente", "cedula": f"U{i:09d}"}
+        for i in range(1, n_usuarios + 1)
+    ])
+    await cargar(Cliente, [
+        {"nombre": f"Cliente {i}", "cedula": f"C{i:09d}",
+         "tipo_cliente": "mayorista" if i % 5 == 0 else "minorista",
+         "cliente_frecuente": "si" if i % 3 == 0 else "no",
+         "usuario_id": rng.randint(1, n_usuarios)}
+        for i in range(1, n_clientes + 1)
+    ])
+
+    precios = []
+    categorias = []  # categoría de cada producto, se copia en sus compras
+    productos = []
+    for i in range(1, n_productos + 1):
+        precio = round(rng.uniform(500, 80000), 2)
+        precios.append(precio)
+        categorias.append(rng.randint(1, n_categorias))
+        productos.append({
+            "nombre": f"{rng.choice(PALABRAS).capitalize()} {rng.choice(ADJETIVOS)} {i}",
+            "descripcion": " ".join(rng.choices(PALABRAS, k=12)),
+            "cantidad": rng.randint(0, 500),
+            "stock_minimo": 10,
+            "valor_unitario": precio,
+            "valor_mayorista": round(precio * 0.85, 2),
+            "categoria_id": categorias[-1],
+            "actualizado_en": ahora,
+        })
+    await cargar(Producto, productos)
+    del productos
+
+    # compras repartidas en los últimos dos años
+    for start in range(0, n_compras, LOTE * 10):
+        lote = []
+        for _ in range(start, min(start + LOTE * 10, n_compras)):
+            pid = rng.randint(1, n_productos)
+            cantidad = rng.randint(1, 10)
+            lote.append({
+                "cliente_id": rng.randint(1, n_clientes),
+                "producto_id": pid,
+                "categoria_id": categorias[pid - 1],
+                "cantidad": cantidad,
+                "total": round(precios[pid - 1] * cantidad, 2),
+                "creado_en": ahora - timedelta(seconds=rng.randint(0, 730 * 86400)),
+            })
+        await cargar(Compra, lote)
+
+    await cargar(HistorialEliminados, [
+        {"tabla": rng.choice(("Producto", "Cliente", "Compra", "Categoria", "Usuario")),
+         "registro_id": i, "datos": {"descripcion": "sembrado", "registro": {"id": i}},
+         "eliminado_en": ahora - timedelta(seconds=rng.randint(0, 365 * 86400))}
+        for i in range(1, 10001)
+    ])
+    print(f"• siembra: {n_productos} productos, {n_compras} compras en {time.perf_counter() - t0:.1f}s")
+
+    from database import AsyncSessionLocal
+    from rollups import reconstruir
+    async with AsyncSessionLocal() as db:
+        n = await reconstruir(db)
+    print(f"• resumen_ventas: {n} filas")
+
+# -----------------------------
+# Escenarios
+# -----------------------------
+@dataclass
+class Escenario:
+    nombre: str
+    grupo: str
+    construir: Callable[[random.Random, dict], Dict[str, Any]]  # -> kwargs de client.request
+    esperado: Set[int] = field(default_factory=lambda: {200})
+    concurrencia_x: int = 1  # multiplicador de --concurrencia (escenarios de sobrecarga)
+
+def _get(url, **params):
+    return {"method": "GET", "url": url, "params": params}
+
+def _post(url, payload):
+    return {"method": "POST", "url": url, "json": payload}
+
+def escenarios(n_productos: int) -> List[Escenario]:
+    pid = lambda rng: rng.randint(1, n_productos)
+    lineas = lambda rng, k: [{"producto_id": p, "cantidad": rng.randint(1, 30)}
+                             for p in rng.sample(range(1, n_productos + 1), min(k, n_productos))]
+    serie = itertools.count(1)
+
+    return [
+        Escenario("GET /health", "health", lambda rng, ctx: _get("/health")),
+        Escenario("GET /metrics", "health", lambda rng, ctx: _get("/metrics")),
+        # listados (keyset, caché, ETag)
+        Escenario("GET /productos/", "listados", lambda rng, ctx: _get("/productos/")),
+        Escenario("GET /productos/?cursor", "listados",
+                  lambda rng, ctx: _get("/productos/", cursor=ctx["cursor_productos"](rng))),
+        Escenario("GET /productos/ If-None-Match", "listados",
+                  lambda rng, ctx: {**_get("/productos/"), "headers": {"If-None-Match": ctx["etag_productos"]}},
+                  {200, 304}),
+        Escenario("GET /categorias/", "listados", lambda rng, ctx: _get("/categorias/")),
+        Escenario("GET /categorias/ If-None-Match", "listados",
+                  lambda rng, ctx: {**_get("/categorias/"), "headers": {"If-None-Match": ctx["etag_categorias"]}},
+                  {200, 304}),
+        Escenario("GET /clientes/", "listados", lambda rng, ctx: _get("/clientes/")),
+        Escenario("GET /usuarios/", "listados", lambda rng, ctx: _get("/usuarios/")),
+        Escenario("GET /usuarios/{id}", "listados", lambda rng, ctx: _get(f"/usuarios/{rng.randint(1, 1000)}")),
+        Escenario("GET /compras/", "listados", lambda rng, ctx: _get("/compras/")),
+        Escenario("GET /compras/?limit=1000", "listados", lambda rng, ctx: _get("/compras/", limit=1000)),
+        Escenario("GET /historial/eliminados", "listados", lambda rng, ctx: _get("/historial/eliminados")),
+        Escenario("GET /productos/historial/eliminados", "listados",
+                  lambda rng, ctx: _get("/productos/historial/eliminados")),
+        Escenario("GET /productos/bajo-stock", "listados", lambda rng, ctx: _get("/productos/bajo-stock")),
+        # búsqueda
+        Escenario("GET /productos/buscar (prefijo)", "busqueda",
+                  lambda rng, ctx: _get("/productos/buscar", q=rng.choice(PALABRAS)[:rng.randint(2, 5)])),
+        Escenario("GET /productos/buscar (2 palabras)", "busqueda",
+                  lambda rng, ctx: _get("/productos/buscar", q=f"{rng.choice(PALABRAS)} {rng.choice(ADJETIVOS)}")),
+        Escenario("GET /categorias/buscar", "busqueda",
+                  lambda rng, ctx: _get("/categorias/buscar", q=f"categ {rng.randint(1, 200)}")),
+        # reportes y exportación
+        Escenario("GET /reportes/ventas (total diario)", "reportes",
+                  lambda rng, ctx: _get("/reportes/ventas", periodo="dia", dimension="total")),
+        Escenario("GET /reportes/ventas (producto mensual)", "reportes",
+                  lambda rng, ctx: _get("/reportes/ventas", periodo="mes", dimension="producto", clave=pid(rng))),
+        Escenario("GET /compras/export (1 día)", "reportes", lambda rng, ctx: _export_dia(rng, "/compras/export")),
+        Escenario("POST /productos/cotizar (200 líneas)", "reportes",
+                  lambda rng, ctx: _post("/productos/cotizar", {"lineas": lineas(rng, 200)})),
+        # escrituras
+        Escenario("POST /compras/", "escrituras",
+                  lambda rng, ctx: _post("/compras/", {"cliente_id": rng.randint(1, 10000), "producto_id": pid(rng),
+                                                       "cantidad": 1, "total": 0}),
+                  {201, 400}),
+        Escenario("POST /compras/ (reintento, Idempotency-Key)", "escrituras",
+                  lambda rng, ctx: {**_post("/compras/", {"cliente_id": 1, "producto_id": 2, "cantidad": 1, "total": 0}),
+                                    "headers": {"Idempotency-Key": "bench-reintento"}},
+                  {201, 400}),
+        Escenario("POST /compras/pedido (10 líneas)", "escrituras",
+                  lambda rng, ctx: _post("/compras/pedido", {"cliente_id": rng.randint(1, 10000),
+                                                             "lineas": [{**l, "cantidad": 1} for l in lineas(rng, 10)]}),
+                  {201, 400}),
+        Escenario("POST /clientes/", "escrituras",
+                  lambda rng, ctx: _post("/clientes/", {"nombre": "Bench", "cedula": f"B{next(serie):09d}",
+                                                        "tipo_cliente": "minorista"}),
+                  {201}),
+        Escenario("POST /clientes/ (cédula duplicada)", "escrituras",
+                  lambda rng, ctx: _post("/clientes/", {"nombre": "Bench", "cedula": f"C{rng.randint(1, 10000):09d}",
+                                                        "tipo_cliente": "minorista"}),
+                  {409}),
+        Escenario("POST /usuarios/", "escrituras",
+                  lambda rng, ctx: _post("/usuarios/", {"nombre": "Bench", "correo": f"bench{next(serie)}@example.com",
+                                                        "rol": "cliente", "contraseña": "secreto-bench"}),
+                  {201}),
+        Escenario("PUT /productos/{id}", "escrituras",
+                  lambda rng, ctx: {"method": "PUT", "url": f"/productos/{pid(rng)}",
+                                    "json": {"valor_unitario": round(rng.uniform(500, 80000), 2)}}),
+        Escenario("POST /productos/importar (500 filas)", "escrituras",
+                  lambda rng, ctx: {"method": "POST", "url": "/productos/importar",
+                                    "files": {"archivo": ("productos.csv", ctx["csv_productos"], "text/csv")}}),
+        # eliminaciones (ids consecutivos, cada petición borra filas distintas)
+        Escenario("DELETE /compras/{id}", "eliminaciones",
+                  lambda rng, ctx: {"method": "DELETE", "url": f"/compras/{next(ctx['compra_ids'])}"},
+                  {204, 404}),
+        Escenario("POST /compras/eliminar (100 ids)", "eliminaciones",
+                  lambda rng, ctx: _post("/compras/eliminar", {"ids": list(itertools.islice(ctx["compra_ids"], 100))})),
+        # sobrecarga: 8x clientes sobre un listado pesado; con control de admisión el exceso se
+        # rechaza pronto (429/503) y la latencia de las admitidas se mantiene acotada
+        Escenario("GET /compras/?limit=1000 (sobrecarga x8)", "sobrecarga",
+                  lambda rng, ctx: _get("/compras/", limit=1000), {200, 429, 503}, concurrencia_x=8),
+    ]
+
+def _export_dia(rng: random.Random, url: str) -> Dict[str, Any]:
+    dia = datetime.now(timezone.utc).date() - timedelta(days=rng.randint(1, 700))
+    return _get(url, formato=rng.choice(("ndjson", "csv")), desde=dia.isoformat(),
+                hasta=(dia + timedelta(days=1)).isoformat())
+
+async def preparar_contexto(client, rng: random.Random, n_productos: int) -> dict:
+    """Datos que los escenarios necesitan de la propia API: ETags y cursores reales."""
+    from pagination import encode_cursor
+
+    ctx: dict = {}
+    for nombre in ("productos", "categorias"):
+        r = await client.get(f"/{nombre}/")
+        ctx[f"etag_{nombre}"] = r.headers.get("etag", "")
+    ultimo = max(1, n_productos - 100)
+    ctx["cursor_productos"] = lambda rng: encode_cursor(rng.randint(1, ultimo))
+    filas = ["nombre,descripcion,cantidad,stock_minimo,valor_unitario,valor_mayorista,categoria_id"]
+    for i in range(500):
+        filas.append(f"Importado {rng.choice(PALABRAS)} {i},lote benchmark,{rng.randint(0, 500)},10,"
+                     f"{rng.uniform(500, 80000):.2f},,{rng.randint(1, 200)}")
+    ctx["csv_productos"] = ("\n".join(filas) + "\n").encode()
+    ctx["compra_ids"] = itertools.count(1)
+    return ctx
+
+# -----------------------------
+# Ejecución y métricas
+# -----------------------------
+def percentil(ordenadas: List[float], p: float) -> float:
+    if not ordenadas:
+        return 0.0
+    k = max(0, min(len(ordenadas) - 1, math.ceil(p / 100 * len(ordenadas)) - 1))
+    return ordenadas[k]
+
+async def correr(client, esc: Escenario, ctx: dict, peticiones: int, concurrencia: int) -> dict:
+    rng = random.Random(f"{SEMILLA}:{esc.nombre}")
+    latencias: List[float] = []
+    latencias_ok: List[float] = []  # solo respuestas < 400 (lo que ve un cliente admitido)
+    codigos: Counter = Counter()
+    turnos = iter(range(peticiones))  # compartido: cada cliente toma la siguiente petición libre
+
+    async def cliente():
+        for _ in turnos:
+            req = esc.construir(rng, ctx)
+            t0 = time.perf_counter()
+            ok = False
+            try:
+                r = await client.request(**req)
+                codigos[str(r.status_code)] += 1
+                ok = r.status_code < 400
+            except Exception as e:  # la app levantó una excepción no manejada
+                codigos[type(e).__name__] += 1
+            latencias.append((time.perf_counter() - t0) * 1000)
+            if ok:
+                latencias_ok.append(latencias[-1])
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(concurrencia)))
+    segundos = time.perf_counter() - t0
+    latencias.sort()
+    latencias_ok.sort()
+    inesperados = sum(n for c, n in codigos.items() if not (c.isdigit() and int(c) in esc.esperado))
+    return {
+        "grupo": esc.grupo,
+        "peticiones": len(latencias),
+        "concurrencia": concurrencia,
+        "segundos": round(segundos, 3),
+        "rps": round(len(latencias) / segundos, 1) if segundos else 0.0,
+        "p50_ms": round(percentil(latencias, 50), 2),
+        "p95_ms": round(percentil(latencias, 95), 2),
+        "p99_ms": round(percentil(latencias, 99), 2),
+        "max_ms": round(latencias[-1], 2) if latencias else 0.0,
+        "p99_ok_ms": round(percentil(latencias_ok, 99), 2),
+        "codigos": dict(codigos),
+        "inesperados": inesperados,
+    }
+
+async def verificar_stock_concurrente(client, producto_id: int, stock: int = 100, intentos: int = 300) -> dict:
+    """Muchas compras simultáneas sobre un mismo producto: el stock nunca debe quedar negativo."""
+    from sqlalchemy import select
+
+    from database import AsyncSessionLocal
+    from models import Producto
+
+    await client.put(f"/productos/{producto_id}", json={"cantidad": stock})
+    payload = {"cliente_id": 1, "producto_id": producto_id, "cantidad": 1, "total": 0}
+    t0 = time.perf_counter()
+    respuestas = await asyncio.gather(
+        *(client.post("/compras/", json=payload) for _ in range(intentos)), return_exceptions=True
+    )
+    segundos = time.perf_counter() - t0
+    async with AsyncSessionLocal() as db:
+        final = (await db.execute(select(Producto.cantidad).where(Producto.id == producto_id))).scalar()
+    # en SQLite algunas fallan por "database is locked" (un solo escritor): cuentan como rechazadas
+    codigos = Counter(
+        type(r).__name__ if isinstance(r, BaseException) else str(r.status_code) for r in respuestas
+    )
+    ok = codigos.pop("201", 0)
+    return {
+        "stock_inicial": stock,
+        "intentos": intentos,
+        "aceptadas": ok,
+        "rechazadas": dict(codigos),
+        "stock_final": final,
+        "rps": round(intentos / segundos, 1),
+        "correcto": final is not None and final >= 0 and ok == stock - final,
+    }
+
+async def verificar_idempotencia(client, intentos: int = 50) -> dict:
+    """Reintentos simultáneos con la misma Idempotency-Key: una sola compra y la misma respuesta."""
+    from sqlalchemy import func, select
+
+    from database import AsyncSessionLocal
+    from models import Compra
+
+    async def contar():
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(select(func.count()).select_from(Compra))).scalar()
+
+    antes = await contar()
+    payload = {"cliente_id": 1, "lineas": [{"producto_id": 3, "cantidad": 1}, {"producto_id": 4, "cantidad": 1}]}
+    clave = f"bench-{datetime.now(timezone.utc).timestamp()}"
+    respuestas = await asyncio.gather(*(
+        client.post("/compras/pedido", json=payload, headers={"Idempotency-Key": clave}) for _ in range(intentos)
+    ))
+    creadas = await contar() - antes
+    return {
+        "intentos": intentos,
+        "codigos": dict(Counter(str(r.status_code) for r in respuestas)),
+        "repetidas": sum(1 for r in respuestas if r.headers.get("idempotent-replayed") == "true"),
+        "cuerpos_distintos": len({r.content for r in respuestas}),
+        "compras_creadas": creadas,
+        "correcto": creadas in (0, len(payload["lineas"])) and len({r.content for r in respuestas}) == 1,
+    }
+
+async def verificar_paginacion(client, limite: int = 1000) -> dict:
+    """Recorre /compras/ siguiendo X-Next-Cursor hasta el final: cada compra una vez y sin ciclos."""
+    from sqlalchemy import func, select
+
+    from database import AsyncSessionLocal
+    from models import Compra
+    from pagination import NEXT_CURSOR_HEADER
+
+    async with AsyncSessionLocal() as db:
+        total = (await db.execute(select(func.count()).select_from(Compra))).scalar()
+    vistos: Set[int] = set()
+    filas = paginas = 0
+    cursor: Optional[str] = None
+    t0 = time.perf_counter()
+    # como mucho las páginas necesarias (+1): si el cursor no avanza, se corta en vez de girar
+    while paginas <= total // limite + 1:
+        params = {"limit": limite, **({"cursor": cursor} if cursor else {})}
+        r = await client.get("/compras/", params=params)
+        paginas += 1
+        ids = [c["id"] for c in r.json()]
+        filas += len(ids)
+        vistos.update(ids)
+        cursor = r.headers.get(NEXT_CURSOR_HEADER)
+        if not cursor:
+            break
+    return {
+        "compras": total,
+        "paginas": paginas,
+        "filas": filas,
+        "repetidas": filas - len(vistos),
+        "segundos": round(time.perf_counter() - t0, 2),
+        "correcto": not cursor and filas == len(vistos) == total,
+    }
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Proceso nuevo: import de main (sin httpx), lifespan (engine, índices, warm-up) y primera petición
+_CODIGO_ARRANQUE = """
+import asyncio, json, time
+import httpx
+t0 = time.perf_counter()
+from main import app
+t_import = time.perf_counter()
+
+async def _arrancar():
+    async with app.router.lifespan_context(app):
+        t_startup = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.get("/productos/", params={"limit": 1})
+        return t_startup, time.perf_counter()
+
+t_startup, t_primera = asyncio.run(_arrancar())
+print(json.dumps({
+    "import_ms": (t_import - t0) * 1000,
+    "lifespan_ms": (t_startup - t_import) * 1000,
+    "primera_peticion_ms": (t_primera - t_startup) * 1000,
+    "total_ms": (t_primera - t0) * 1000,
+}))
+"""
+
+def medir_arranque(veces: int) -> dict:
+    """Arranque en frío de main.app en `veces` procesos nuevos (lo que paga un contenedor scale-to-zero)."""
+    muestras: List[dict] = []
+    for _ in range(veces):
+        t0 = time.perf_counter()
+        p = subprocess.run(
+            [sys.executable, "-c", _CODIGO_ARRANQUE], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=os.environ,
+        )
+        m = json.loads(p.stdout.strip().splitlines()[-1])
+        m["proceso_ms"] = (time.perf_counter() - t0) * 1000  # incluye arrancar el intérprete
+        muestras.append(m)
+    mediana = {k: round(percentil(sorted(x[k] for x in muestras), 50), 1) for k in muestras[0]}
+    return {"veces": veces, "mediana_ms": mediana, "muestras": muestras}
+
+def comparar(actual: dict, anterior: dict) -> None:
+    print(f"\nComparación con {anterior['meta'].get('commit')} ({anterior['meta'].get('fecha')}):")
+    print(f"{'endpoint':45} {'p50 ms':>16} {'p95 ms':>16} {'rps':>16}")
+    for nombre, r in actual["resultados"].items():
+        a = anterior["resultados"].get(nombre)
+        if not a:
+            continue
+        delta = lambda k: f"{a[k]:>7} → {r[k]:<7}"
+        print(f"{nombre[:45]:45} {delta('p50_ms'):>16} {delta('p95_ms'):>16} {delta('rps'):>16}")
+
+async def _main(args) -> dict:
+    import httpx
+
+    from database import get_engine, pool_stats
+    from main import app
+
+    dialecto = get_engine().url.drivername
+    await sembrar(get_engine(), args.productos, args.compras)
+
+    resultados: Dict[str, dict] = {}
+    verificaciones: Dict[str, dict] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):  # startup/shutdown de la app (índices, cola de historial)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            ctx = await preparar_contexto(client, random.Random(SEMILLA), args.productos)
+            for esc in escenarios(args.productos):
+                if args.solo and esc.grupo not in args.solo:
+                    continue
+                # calentamiento corto (caché, planes de consulta) fuera de la medición
+                await correr(client, esc, ctx, min(20, args.peticiones), 1)
+                r = await correr(client, esc, ctx, args.peticiones, args.concurrencia * esc.concurrencia_x)
+                resultados[esc.nombre] = r
+                print(f"{esc.nombre[:45]:45} {r['rps']:>9} rps  p50 {r['p50_ms']:>8} ms  "
+                      f"p95 {r['p95_ms']:>8} ms  p99 {r['p99_ms']:>8} ms  {r['codigos']}")
+            if not args.solo or "escrituras" in args.solo:
+                v = await verificar_stock_concurrente(client, producto_id=1)
+                verificaciones["stock_concurrente"] = v
+                print(f"• stock concurrente: {v}")
+                v = await verificar_idempotencia(client)
+                verificaciones["idempotencia"] = v
+                print(f"• idempotencia: {v}")
+            if not args.solo or "listados" in args.solo:
+                # después de las escrituras: mezcla filas sembradas y filas con el server_default
+                v = await verificar_paginacion(client)
+                verificaciones["paginacion_compras"] = v
+                print(f"• paginación /compras/: {v}")
+        pool = pool_stats()  # antes del shutdown, que cierra el engine
+
+    return {"meta": _meta(args, dialecto, pool), "resultados": resultados, "verificaciones": verificaciones}
+
+async def _crear_tablas() -> str:
+    from database import dispose_engine, get_engine
+    from models import Base  # al importar models las tablas quedan en Base.metadata
+
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    dialecto = get_engine().url.drivername
+    await dispose_engine()
+    return dialecto
+
+def _meta(args, dialecto: str, pool: Optional[dict] = None) -> dict:
+    return {
+        "commit": _commit(),
+        "fecha": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "dialecto": dialecto,
+        "productos": args.productos,
+        "compras": args.compras,
+        "concurrencia": args.concurrencia,
+        "peticiones": args.peticiones,
+        "entorno": {k: os.environ[k] for k in ENV_REPORTADAS if k in os.environ},
+        "pool": pool,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de la API (httpx + ASGITransport)")
+    parser.add_argument("--db", help="URL de la base; por defecto SQLite temporal")
+    parser.add_argument("--productos", type=int, default=100_000)
+    parser.add_argument("--compras", type=int, default=1_000_000)
+    parser.add_argument("--concurrencia", type=int, default=32)
+    parser.add_argument("--peticiones", type=int, default=1000, help="peticiones medidas por endpoint")
+    parser.add_argument("--solo", type=lambda s: set(s.split(",")),
+                        help="grupos: health,listados,busqueda,reportes,escrituras,eliminaciones,sobrecarga; "
+                             "'arranque' solo mide el arranque en frío, sin sembrar")
+    parser.add_argument("--salida", help="archivo JSON de resultados (por defecto bench_results/<fecha>_<commit>.json)")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    parser.add_argument("--arranque", type=int, default=0, metavar="N",
+                        help="mide además N arranques en frío de main.app (procesos nuevos)")
+    args = parser.parse_args()
+
+    # la URL debe quedar fijada antes de importar database/main
+    os.environ["DATABASE_URL"] = args.db or (
+        "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bench_"), "bench.db")
+    )
+    print(f"• base: {os.environ['DATABASE_URL']}")
+    # con SQLite y muchos escritores concurrentes casi todo supera SLOW_QUERY_MS; el conteo sigue en /metrics
+    logging.getLogger("sql.slow").setLevel(logging.ERROR)
+
+    if args.solo == {"arranque"}:
+        # solo arranque en frío: tablas (la primera petición las consulta) sin siembra ni escenarios
+        args.arranque = args.arranque or 5
+        resultado = {
+            "meta": _meta(args, asyncio.run(_crear_tablas())),
+            "resultados": {},
+            "verificaciones": {},
+        }
+    else:
+        resultado = asyncio.run(_main(args))
+    if args.arranque:
+        resultado["arranque"] = medir_arranque(args.arranque)
+        print(f"• arranque en frío (mediana de {args.arranque}): {resultado['arranque']['mediana_ms']}")
+
+    salida = args.salida or os.path.join(
+        "bench_results", f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}_{resultado['meta']['commit'] or 'local'}.json"
+    )
+    os.makedirs(os.path.dirname(salida) or ".", exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as fh:
+        json.dump(resultado, fh, ensure_ascii=False, indent=2)
+    print(f"✔ resultados: {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as fh:
+            comparar(resultado, json.load(fh))
+
+if __name__ == "__main__":
+    main()
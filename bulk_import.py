@@ -0,0 +1,187 @@
+# bulk_import.py
+# Importación masiva (CSV / JSON Lines) para productos, clientes y categorías.
+# Las filas se validan con los esquemas *Create en bloques de CHUNK_ROWS y cada bloque se escribe
+# con executemany y un solo commit. Si un bloque falla en la BD, se reintenta fila a fila para
+# reportar exactamente qué filas fallaron sin perder el resto.
+# La lectura y validación de cada bloque corre en el threadpool (es CPU puro y leer el archivo
+# subido bloquea), así una subida grande no detiene el event loop.
+from __future__ import annotations
+import csv
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+CHUNK_ROWS = 1000
+MAX_ERRORES = 1000  # errores devueltos en la respuesta (el total siempre se informa)
+
+Fila = Tuple[int, Dict[str, Any]]  # (número de fila en el archivo, datos)
+
+def _detect_formato(upload: UploadFile, formato: Optional[str]) -> str:
+    if formato:
+        fmt = formato.lower()
+    else:
+        name = (upload.filename or "").lower()
+        fmt = "csv" if name.endswith(".csv") else "jsonl"
+    if fmt not in ("csv", "jsonl"):
+        raise HTTPException(status_code=400, detail="Formato no soportado (usa 'csv' o 'jsonl')")
+    return fmt
+
+NO_UTF8 = "La fila no está en UTF-8"
+
+def _lineas(upload: UploadFile) -> Iterator[str]:
+    # surrogateescape: una línea con bytes inválidos no corta el archivo (los bloques anteriores
+    # ya pueden estar escritos); queda marcada y se reporta como error de esa fila
+    for n, raw in enumerate(upload.file, start=1):
+        yield raw.decode("utf-8-sig" if n == 1 else "utf-8", errors="surrogateescape")
+
+def _no_utf8(texto: str) -> bool:
+    try:
+        texto.encode("utf-8")
+        return False
+    except UnicodeEncodeError:
+        return True
+
+def _iter_raw(upload: UploadFile, fmt: str) -> Iterator[Tuple[int, Any]]:
+    text = _lineas(upload)
+    if fmt == "csv":
+        for n, row in enumerate(csv.DictReader(text), start=2):  # fila 1 = cabecera
+            if any(isinstance(v, str) and _no_utf8(v) for v in row.values()):
+                yield n, UnicodeError(NO_UTF8)
+                continue
+            # en CSV una celda vacía significa "sin valor"
+            yield n, {k: (v if v != "" else None) for k, v in row.items() if k}
+    else:
+        for n, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            if _no_utf8(line):
+                yield n, UnicodeError(NO_UTF8)
+                continue
+            try:
+                yield n, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield n, e
+
+class ImportResult:
+    def __init__(self):
+        self.procesadas = 0
+        self.insertadas = 0
+        self.actualizadas = 0
+        self.errores_total = 0
+        self.errores: List[Dict[str, Any]] = []
+
+    def error(self, fila: int, detalle: str):
+        self.errores_total += 1
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append({"fila": fila, "error": detalle})
+
+    def as_dict(self) -> dict:
+        return {
+            "procesadas": self.procesadas,
+            "insertadas": self.insertadas,
+            "actualizadas": self.actualizadas,
+            "errores_total": self.errores_total,
+            "errores": self.errores,
+        }
+
+async def _write_chunk(db: AsyncSession, model, key: Optional[str], rows: List[Fila]) -> Tuple[int, int]:
+    """
+    Escribe un bloque. Con `key` hace upsert: un SELECT ... IN para saber qué claves existen,
+    INSERT executemany para las nuevas y UPDATE executemany (por id) para las existentes.
+    """
+    if key is None:
+        await db.execute(insert(model), [data for _, data in rows])
+        return len(rows), 0
+
+    # si la clave se repite dentro del bloque, gana la última fila
+    por_clave: Dict[Any, Dict[str, Any]] = {}
+    sin_clave: List[Dict[str, Any]] = []
+    for _, data in rows:
+        if data.get(key) is None:
+            sin_clave.append(data)
+        else:
+            por_clave[data[key]] = data
+
+    existentes: Dict[Any, int] = {}
+    if por_clave:
+        col = getattr(model, key)
+        q = await db.execute(select(col, model.id).where(col.in_(list(por_clave))))
+        existentes = {k: i for k, i in q.all()}
+
+    nuevas = sin_clave + [d for k, d in por_clave.items() if k not in existentes]
+    cambios = [{"id": existentes[k], **d} for k, d in por_clave.items() if k in existentes]
+    if nuevas:
+        await db.execute(insert(model), nuevas)
+    if cambios:
+        await db.execute(update(model), cambios)
+    return len(nuevas), len(cambios)
+
+async def _flush_chunk(db: AsyncSession, model, key: Optional[str], rows: List[Fila], result: ImportResult):
+    if not rows:
+        return
+    try:
+        ins, upd = await _write_chunk(db, model, key, rows)
+        await db.commit()
+        result.insertadas += ins
+        result.actualizadas += upd
+        return
+    except DBAPIError:
+        await db.rollback()
+
+    # el bloque tenía al menos una fila que la BD rechaza: aislarla
+    for fila, data in rows:
+        try:
+            ins, upd = await _write_chunk(db, model, key, [(fila, data)])
+            await db.commit()
+            result.insertadas += ins
+            result.actualizadas += upd
+        except DBAPIError as e:
+            await db.rollback()
+            result.error(fila, str(e.orig) if getattr(e, "orig", None) else str(e))
+
+def _leer_bloque(filas: Iterator[Tuple[int, Any]], schema: Type[BaseModel], result: ImportResult) -> Tuple[List[Fila], bool]:
+    """Lee y valida hasta CHUNK_ROWS filas; devuelve (bloque, se acabó el archivo). Corre en un hilo."""
+    chunk: List[Fila] = []
+    for fila, raw in filas:
+        result.procesadas += 1
+        if isinstance(raw, UnicodeError):
+            result.error(fila, str(raw))
+            continue
+        if isinstance(raw, Exception):
+            result.error(fila, f"JSON inválido: {raw}")
+            continue
+        try:
+            obj = schema.model_validate(raw)
+        except ValidationError as e:
+            result.error(fila, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            continue
+        chunk.append((fila, obj.model_dump()))
+        if len(chunk) >= CHUNK_ROWS:
+            return chunk, False
+    return chunk, True
+
+async def import_upload(
+    db: AsyncSession,
+    upload: UploadFile,
+    formato: Optional[str],
+    schema: Type[BaseModel],
+    model,
+    key: Optional[str] = None,
+) -> dict:
+    """Valida con `schema` y escribe en `model`; `key` activa el upsert por esa columna única."""
+    fmt = _detect_formato(upload, formato)
+    result = ImportResult()
+    filas = _iter_raw(upload, fmt)
+
+    fin = False
+    while not fin:
+        # un bloque a la vez: nunca hay dos hilos avanzando el mismo iterador
+        chunk, fin = await run_in_threadpool(_leer_bloque, filas, schema, result)
+        await _flush_chunk(db, model, key, chunk, result)
+    return result.as_dict()
@@ -0,0 +1,81 @@
+# cache.py
+# Caché en proceso (LRU + TTL) para las lecturas del catálogo: categorías y productos.
+# Cada entrada pertenece a un namespace ("categorias", "productos") y las escrituras
+# invalidan solo su namespace. Es por proceso: con varios workers, el TTL acota lo desactualizado.
+# Cada namespace tiene una generación que invalidate() incrementa: una lectura que empezó antes
+# de una escritura pasa la generación que vio a set(), y si cambió mientras consultaba no guarda
+# su resultado (ya viejo) en la caché.
+from __future__ import annotations
+import os
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Hashable, Optional
+
+class TTLCache:
+    def __init__(self, maxsize: int = 512, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[tuple[str, Hashable], tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+        self._generations: Dict[str, int] = defaultdict(int)
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        k = (namespace, key)
+        item = self._data.get(k)
+        if item is None:
+            self.misses += 1
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[k]
+            self.misses += 1
+            return None
+        self._data.move_to_end(k)
+        self.hits += 1
+        return value
+
+    def generation(self, namespace: str) -> int:
+        return self._generations[namespace]
+
+    def set(self, namespace: str, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        """`generation`: la de generation() antes de consultar; si hubo un invalidate() desde entonces, no se guarda."""
+        if self.maxsize <= 0:
+            return
+        if generation is not None and generation != self._generations[namespace]:
+            self.stale_sets += 1
+            return
+        k = (namespace, key)
+        self._data[k] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(k)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, namespace: str) -> None:
+        self._generations[namespace] += 1
+        for k in [k for k in self._data if k[0] == namespace]:
+            del self._data[k]
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "stale_sets": self.stale_sets,
+        }
+
+catalog_cache = TTLCache(
+    maxsize=int(os.getenv("CATALOG_CACHE_SIZE", "512")),  # 0 desactiva la caché
+    ttl=float(os.getenv("CATALOG_CACHE_TTL", "60")),
+)
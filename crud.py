@@ -1,24 +1,74 @@
-from typing import List, Optional, Tuple, Dict
-from decimal import Decimal
+from typing import Any, List, Optional, Set, Tuple, Dict
+from decimal import Decimal, ROUND_HALF_UP
 from fastapi import HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import select, update, insert, UniqueConstraint
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
 from models import Categoria, Producto, Cliente, Compra, Usuario
 import schemas
+from rollups import registrar_ventas, fecha_de
+from passwords import hash_password
+
+# ==============================
+# ---- RESTRICCIONES ÚNICAS ----
+# ==============================
+
+def _restriccion_unica(e: IntegrityError) -> Optional[str]:
+    """
+    Restricción UNIQUE violada: `constraint_name` del error de asyncpg (SQLSTATE 23505) o
+    "tabla.columna" del mensaje de SQLite. None si el error no es de unicidad.
+    """
+    orig = e.orig
+    if getattr(orig, "sqlstate", None) == "23505":
+        return getattr(orig, "constraint_name", None) or getattr(orig.__cause__, "constraint_name", None)
+    texto = str(orig)
+    prefijo = "UNIQUE constraint failed: "
+    return texto[len(prefijo):] if texto.startswith(prefijo) else None
+
+def _nombres_unicos(columna) -> Set[str]:
+    """Nombres con que cada motor reporta la restricción UNIQUE (o índice único) de `columna`."""
+    col = columna.property.columns[0]
+    tabla = col.table
+    nombres = {f"{tabla.name}.{col.name}"}  # SQLite
+    for c in tabla.constraints:
+        if isinstance(c, UniqueConstraint) and [x.name for x in c.columns] == [col.name]:
+            nombres.add(c.name or f"{tabla.name}_{col.name}_key")  # nombre por defecto de Postgres
+    for i in tabla.indexes:
+        if i.unique and [x.name for x in i.columns] == [col.name]:
+            nombres.add(i.name)
+    return nombres
+
+async def commit_unico(db: AsyncSession, mensajes: Dict[Any, Tuple[int, str]]) -> None:
+    """
+    Commit que confía en las restricciones UNIQUE de la BD en lugar de un SELECT previo.
+    `mensajes` va de columna del modelo (p. ej. Usuario.correo) a (status, detalle); si se viola
+    la restricción de una de ellas se responde con ese detalle y cualquier otro error se propaga.
+    """
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        violada = _restriccion_unica(e)
+        if violada is not None:
+            for columna, (code, detail) in mensajes.items():
+                if violada in _nombres_unicos(columna):
+                    raise HTTPException(code, detail)
+        raise
+
+def es_violacion_fk(e: IntegrityError) -> bool:
+    """FOREIGN KEY inexistente: SQLSTATE 23503 en Postgres, "FOREIGN KEY constraint failed" en SQLite."""
+    return getattr(e.orig, "sqlstate", None) == "23503" or "FOREIGN KEY constraint failed" in str(e.orig)
 
 # ==============================
 # -------- CATEGORÍAS ----------
 # ==============================
 
 async def crear_categoria(db: AsyncSession, data: schemas.CategoriaCreate) -> Categoria:
-    q = await db.execute(select(Categoria).where(Categoria.nombre == data.nombre))
-    if q.scalar_one_or_none():
-        raise HTTPException(400, "La categoría ya existe")
     obj = Categoria(**data.model_dump())
     db.add(obj)
-    await db.commit()
+    await commit_unico(db, {Categoria.nombre: (400, "La categoría ya existe")})
     await db.refresh(obj)
     return obj
 
@@ -112,12 +162,43 @@ async def borrar_producto(db: AsyncSession, producto_id: int) -> None:
     await db.delete(obj)
     await db.commit()
 
-async def productos_bajo_stock(db: AsyncSession) -> List[Producto]:
-    # OJO: requiere que tu modelo tenga 'stock_minimo'. Si no, elimínalo o ajústalo.
-    q = await db.execute(select(Producto).where(Producto.stock <= Producto.stock_minimo))
+async def productos_bajo_stock(db: AsyncSession, limit: int = 100, despues_de: Optional[int] = None) -> List[Producto]:
+    # el predicado coincide con el índice parcial ix_productos_bajo_stock: solo lee las filas bajo umbral
+    stmt = select(Producto).where(Producto.cantidad <= Producto.stock_minimo)
+    if despues_de is not None:
+        stmt = stmt.where(Producto.id > despues_de)
+    q = await db.execute(stmt.order_by(Producto.id).limit(limit))
     return q.scalars().all()
 
-# NEW: cálculo de precio por cantidad aplicando umbral_mayor/valor_unitario_mayor
+# NEW: cálculo de precio por cantidad aplicando umbral mayorista/valor_mayorista
+UMBRAL_MAYOR_DEFAULT = 20
+CENTAVOS = Decimal("0.01")
+
+def _precios(prod: Producto) -> Tuple[Decimal, Optional[Decimal], int]:
+    # (valor_unitario, valor_mayorista, umbral) ya como Decimal, una conversión por producto
+    pm = Decimal(str(prod.valor_mayorista)) if prod.valor_mayorista is not None else None
+    umbral = getattr(prod, "umbral_mayor", None) or UMBRAL_MAYOR_DEFAULT
+    return Decimal(str(prod.valor_unitario)), pm, umbral
+
+def _es_mayorista(precios: Tuple[Decimal, Optional[Decimal], int], cantidad: int) -> bool:
+    _, pm, umbral = precios
+    return cantidad > umbral and pm is not None
+
+def _aplicar_precio(precios: Tuple[Decimal, Optional[Decimal], int], cantidad: int) -> Tuple[Decimal, Decimal]:
+    pu, pm, _ = precios
+    if _es_mayorista(precios, cantidad):
+        pu = pm
+    # asegurar Decimal con 2 decimales
+    total = (pu * Decimal(cantidad)).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+    return pu, total
+
+def precio_para_cantidad(prod: Producto, cantidad: int) -> Tuple[Decimal, Decimal]:
+    """
+    Versión sin consulta de calcular_precio_para_cantidad, para productos ya cargados.
+    Regla: si cantidad > umbral_mayor y existe valor_mayorista, usar ese precio.
+    """
+    return _aplicar_precio(_precios(prod), cantidad)
+
 async def calcular_precio_para_cantidad(
     db: AsyncSession,
     producto_id: int,
@@ -125,21 +206,48 @@ async def calcular_precio_para_cantidad(
 ) -> Tuple[Decimal, Decimal]:
     """
     Devuelve (precio_unitario_aplicado, total).
-    Regla: si cantidad > umbral_mayor y existe valor_unitario_mayor, usar ese precio.
+    Regla: si cantidad > umbral_mayor y existe valor_mayorista, usar ese precio.
     """
     if cantidad <= 0:
         raise HTTPException(400, "Cantidad debe ser > 0")
 
     prod = await obtener_producto(db, producto_id)
-    precio_unit = prod.valor_unitario
-    umbral = prod.umbral_mayor or 20
-    if cantidad > umbral and getattr(prod, "valor_unitario_mayor", None) is not None:
-        precio_unit = prod.valor_unitario_mayor
+    return precio_para_cantidad(prod, cantidad)
 
-    # asegurar Decimal con 2 decimales
-    pu = Decimal(str(precio_unit))
-    total = (pu * Decimal(cantidad)).quantize(Decimal("0.01"))
-    return pu, total
+
+# NEW: cotización de muchas líneas con una sola consulta
+async def cotizar(db: AsyncSession, lineas: List[schemas.PedidoLinea]) -> Tuple[List[dict], Decimal]:
+    """
+    Devuelve (líneas cotizadas, total). Carga todos los productos con un IN y convierte
+    sus precios a Decimal una sola vez, aunque aparezcan en varias líneas.
+    """
+    if not lineas:
+        return [], Decimal("0.00")
+    if any(l.cantidad <= 0 for l in lineas):
+        raise HTTPException(400, "Cantidad debe ser > 0")
+
+    ids = {l.producto_id for l in lineas}
+    q = await db.execute(
+        select(Producto.id, Producto.valor_unitario, Producto.valor_mayorista).where(Producto.id.in_(ids))
+    )
+    precios = {row.id: _precios(row) for row in q.all()}
+    faltantes = ids - precios.keys()
+    if faltantes:
+        raise HTTPException(404, f"Producto(s) no encontrado(s): {sorted(faltantes)}")
+
+    resultado = []
+    total = Decimal("0.00")
+    for l in lineas:
+        pu, subtotal = _aplicar_precio(precios[l.producto_id], l.cantidad)
+        total += subtotal
+        resultado.append({
+            "producto_id": l.producto_id,
+            "cantidad": l.cantidad,
+            "precio_unitario": pu,
+            "mayorista": _es_mayorista(precios[l.producto_id], l.cantidad),
+            "total": subtotal,
+        })
+    return resultado, total
 
 
 # ==============================
@@ -147,12 +255,9 @@ async def calcular_precio_para_cantidad(
 # ==============================
 
 async def crear_cliente(db: AsyncSession, data: schemas.ClienteCreate) -> Cliente:
-    q = await db.execute(select(Cliente).where(Cliente.cedula == data.cedula))
-    if q.scalar_one_or_none():
-        raise HTTPException(400, "Ya existe un cliente con esa cédula")
     obj = Cliente(**data.model_dump())
     db.add(obj)
-    await db.commit()
+    await commit_unico(db, {Cliente.cedula: (400, "Ya existe un cliente con esa cédula")})
     await db.refresh(obj)
     return obj
 
@@ -170,13 +275,9 @@ async def obtener_cliente(db: AsyncSession, cliente_id: int) -> Cliente:
 async def actualizar_cliente(db: AsyncSession, cliente_id: int, data: schemas.ClienteUpdate) -> Cliente:
     obj = await obtener_cliente(db, cliente_id)
     payload = data.model_dump(exclude_none=True)
-    if "cedula" in payload:
-        q = await db.execute(select(Cliente).where(Cliente.cedula == payload["cedula"], Cliente.id != cliente_id))
-        if q.scalar_one_or_none():
-            raise HTTPException(400, "Ya existe otro cliente con esa cédula")
     for k, v in payload.items():
         setattr(obj, k, v)
-    await db.commit()
+    await commit_unico(db, {Cliente.cedula: (400, "Ya existe otro cliente con esa cédula")})
     await db.refresh(obj)
     return obj
 
@@ -191,12 +292,14 @@ async def borrar_cliente(db: AsyncSession, cliente_id: int) -> None:
 # ==============================
 
 async def crear_usuario(db: AsyncSession, data: schemas.UsuarioCreate) -> Usuario:
-    q = await db.execute(select(Usuario).where(Usuario.cedula == data.cedula))
-    if q.scalar_one_or_none():
-        raise HTTPException(400, "Ya existe un usuario con esa cédula")
-    obj = Usuario(**data.model_dump())
+    payload = data.model_dump()
+    payload["contraseña"] = await hash_password(payload["contraseña"])
+    obj = Usuario(**payload)
     db.add(obj)
-    await db.commit()
+    await commit_unico(db, {
+        Usuario.correo: (400, "Ya existe un usuario con ese correo"),
+        Usuario.cedula: (400, "Ya existe un usuario con esa cédula"),
+    })
     await db.refresh(obj)
     return obj
 
@@ -235,13 +338,14 @@ async def obtener_usuario(db: AsyncSession, usuario_id: int) -> Usuario:
 async def actualizar_usuario(db: AsyncSession, usuario_id: int, data: schemas.UsuarioUpdate) -> Usuario:
     obj = await obtener_usuario(db, usuario_id)
     payload = data.model_dump(exclude_none=True)
-    if "cedula" in payload:
-        q = await db.execute(select(Usuario).where(Usuario.cedula == payload["cedula"], Usuario.id != usuario_id))
-        if q.scalar_one_or_none():
-            raise HTTPException(400, "Ya existe otro usuario con esa cédula")
+    if "contraseña" in payload:
+        payload["contraseña"] = await hash_password(payload["contraseña"])
     for k, v in payload.items():
         setattr(obj, k, v)
-    await db.commit()
+    await commit_unico(db, {
+        Usuario.correo: (400, "Ya existe otro usuario con ese correo"),
+        Usuario.cedula: (400, "Ya existe otro usuario con esa cédula"),
+    })
     await db.refresh(obj)
     return obj
 
@@ -256,41 +360,114 @@ async def borrar_usuario(db: AsyncSession, usuario_id: int) -> None:
 # ==============================
 
 async def crear_compra(db: AsyncSession, data: schemas.CompraCreate) -> Compra:
-    # valida cliente
-    qcli = await db.execute(select(Cliente).where(Cliente.id == data.cliente_id))
-    cliente = qcli.scalar_one_or_none()
-    if not cliente:
-        raise HTTPException(404, "Cliente no encontrado")
-
-    # valida producto
-    qpro = await db.execute(select(Producto).where(Producto.id == data.producto_id))
-    producto = qpro.scalar_one_or_none()
-    if not producto:
-        raise HTTPException(404, "Producto no encontrado")
-
     if data.cantidad <= 0:
         raise HTTPException(400, "La cantidad debe ser mayor a 0")
 
-    if producto.stock < data.cantidad:
+    # DESCUENTO DE STOCK atómico: un solo UPDATE condicional, sin carrera entre compras concurrentes
+    res = await db.execute(
+        update(Producto)
+        .where(Producto.id == data.producto_id, Producto.cantidad >= data.cantidad)
+        .values(cantidad=Producto.cantidad - data.cantidad)
+        .returning(Producto.id, Producto.categoria_id)
+        .execution_options(synchronize_session=False)
+    )
+    producto = res.one_or_none()
+    if producto is None:
+        # solo en el camino de error: distinguir producto inexistente de stock insuficiente
+        existe = (await db.execute(select(Producto.id).where(Producto.id == data.producto_id))).scalar_one_or_none()
+        await db.rollback()
+        if existe is None:
+            raise HTTPException(404, "Producto no encontrado")
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Stock insuficiente")
 
-    # DESCUENTO DE STOCK
-    producto.stock -= data.cantidad
-
     # Si quieres guardar el precio aplicado aquí, añade campos en tu modelo/esquema de Compra.
     # Puedes calcularlo reutilizando la lógica de precio por cantidad:
     # pu, total = await calcular_precio_para_cantidad(db, producto.id, data.cantidad)
-    # compra = Compra(**data.model_dump(), precio_unitario_aplicado=pu, total=total)
-    # Por ahora, mantengo tu estructura original:
-
-    compra = Compra(**data.model_dump())
 
-    db.add(compra)
-    db.add(producto)
-    await db.commit()
-    await db.refresh(compra)
+    # el cliente lo valida la FK: si no existe, el INSERT falla y se revierte también el descuento
+    try:
+        res = await db.execute(
+            insert(Compra).values(**data.model_dump(), categoria_id=producto.categoria_id).returning(Compra)
+        )
+        compra = res.scalar_one()
+        await registrar_ventas(db, [(
+            fecha_de(compra.creado_en), compra.producto_id, compra.categoria_id,
+            compra.cliente_id, compra.cantidad, compra.total,
+        )])
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if es_violacion_fk(e):  # el producto ya existe (se acaba de actualizar): la FK que falla es la del cliente
+            raise HTTPException(404, "Cliente no encontrado")
+        raise
     return compra
 
+# NEW: pedido con varias líneas, una sola transacción
+async def crear_pedido(db: AsyncSession, data: schemas.PedidoCreate) -> Tuple[List[Compra], Decimal]:
+    """
+    Inserta una Compra por línea y descuenta el stock de todos los productos en un único commit.
+    Devuelve (compras, total_pedido).
+    """
+    if not data.lineas:
+        raise HTTPException(400, "El pedido no tiene líneas")
+
+    pedido: Dict[int, int] = {}  # producto_id -> cantidad total pedida
+    for linea in data.lineas:
+        if linea.cantidad <= 0:
+            raise HTTPException(400, "La cantidad debe ser mayor a 0")
+        pedido[linea.producto_id] = pedido.get(linea.producto_id, 0) + linea.cantidad
+
+    # un solo IN; FOR UPDATE en orden de id para que dos pedidos nunca se bloqueen en cruz
+    q = await db.execute(
+        select(Producto)
+        .where(Producto.id.in_(sorted(pedido)))
+        .order_by(Producto.id)
+        .with_for_update()
+    )
+    productos = {p.id: p for p in q.scalars().all()}
+
+    faltantes = [pid for pid in pedido if pid not in productos]
+    if faltantes:
+        await db.rollback()
+        raise HTTPException(404, f"Producto(s) no encontrado(s): {sorted(faltantes)}")
+    sin_stock = [pid for pid, n in pedido.items() if productos[pid].cantidad < n]
+    if sin_stock:
+        await db.rollback()
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Stock insuficiente para producto(s): {sorted(sin_stock)}")
+
+    # DESCUENTO DE STOCK (filas bloqueadas, el ORM lo envía como executemany en el flush)
+    for pid, n in pedido.items():
+        productos[pid].cantidad -= n
+
+    filas = []
+    total_pedido = Decimal("0.00")
+    for linea in data.lineas:
+        _, total = precio_para_cantidad(productos[linea.producto_id], linea.cantidad)
+        total_pedido += total
+        filas.append({
+            "cliente_id": data.cliente_id,
+            "producto_id": linea.producto_id,
+            "categoria_id": productos[linea.producto_id].categoria_id,
+            "cantidad": linea.cantidad,
+            "total": float(total),
+        })
+
+    try:
+        await db.flush()
+        res = await db.execute(insert(Compra).returning(Compra), filas)
+        compras = list(res.scalars().all())
+        await registrar_ventas(db, [
+            (fecha_de(c.creado_en), c.producto_id, c.categoria_id, c.cliente_id, c.cantidad, c.total)
+            for c in compras
+        ])
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if es_violacion_fk(e):  # los productos están bloqueados y existen: la FK que falla es la del cliente
+            raise HTTPException(404, "Cliente no encontrado")
+        raise
+    return compras, total_pedido
+
 async def listar_compras(db: AsyncSession) -> List[Compra]:
     q = await db.execute(select(Compra).order_by(Compra.fecha.desc()))
     return q.scalars().all()
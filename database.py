@@ -1,13 +1,17 @@
 # database.py
 from __future__ import annotations
+import asyncio
 import os
+import time
 from urllib.parse import urlparse, urlunparse
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import declarative_base
-from sqlalchemy.pool import NullPool
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 from dotenv import load_dotenv
+from starlette.requests import Request  # no fastapi: importar models no debe cargar el framework
 
-load_dotenv()  # OJO: en Render solo se usa si subiste un .env. Si no, puedes quitarlo.
+from metrics import db_acquire
 
 def normalize_asyncpg_url(url: str) -> str:
     if not url:
@@ -15,6 +19,10 @@ def normalize_asyncpg_url(url: str) -> str:
 
     url = url.strip()  # elimina espacios/saltos que rompen DNS
 
+    # SQLite (aiosqlite) para pruebas/benchmarks locales: se usa tal cual
+    if url.startswith("sqlite"):
+        return url
+
     # Normaliza esquema
     if url.startswith("postgres://"):
         url = url.replace("postgres://", "postgresql://", 1)
@@ -33,21 +41,298 @@ def normalize_asyncpg_url(url: str) -> str:
     p_clean = p._replace(scheme="postgresql+asyncpg", params="", query="", fragment="")
     return urlunparse(p_clean)
 
-RAW_URL = os.getenv("DATABASE_URL", "")
-ASYNC_URL = normalize_asyncpg_url(RAW_URL)
+def _env_bool(name: str, default: bool) -> bool:
+    val = os.getenv(name)
+    if val is None or val.strip() == "":
+        return default
+    return val.strip().lower() in ("1", "true", "si", "sí", "yes", "on")
+
+def _env_int(name: str, default: int) -> int:
+    val = os.getenv(name)
+    if val is None or val.strip() == "":
+        return default
+    return int(val)
+
+# -----------------------------
+# Espera al adquirir conexión
+# -----------------------------
+# Se mide dentro del pool, en el momento en que la sesión pide de verdad una conexión (primera
+# consulta), no al abrir la sesión: una petición que no consulta (p. ej. un acierto de caché) no
+# abre conexión. Con NullPool la espera es el connect completo (TCP + TLS + auth).
+# Primaria y réplica llevan contadores separados (y la etiqueta bd en la métrica).
+def _nuevas_stats() -> dict:
+    return {"checkouts": 0, "connects": 0, "acquires": 0, "wait_total_ms": 0.0, "wait_max_ms": 0.0}
+
+_pool_stats = _nuevas_stats()
+_replica_pool_stats = _nuevas_stats()
+
+def _observar_espera(stats: dict, bd: str, t0: float) -> None:
+    waited = (time.perf_counter() - t0) * 1000
+    db_acquire.observe(waited / 1000, bd=bd)
+    stats["acquires"] += 1
+    stats["wait_total_ms"] += waited
+    if waited > stats["wait_max_ms"]:
+        stats["wait_max_ms"] = waited
+
+class _MedirEspera:
+    _stats: dict
+    _bd: str
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            _observar_espera(self._stats, self._bd, t0)
+
+class _TimedNullPool(_MedirEspera, NullPool):
+    _stats, _bd = _pool_stats, "primaria"
+
+class _TimedQueuePool(_MedirEspera, AsyncAdaptedQueuePool):
+    _stats, _bd = _pool_stats, "primaria"
+
+class _ReplicaNullPool(_MedirEspera, NullPool):
+    _stats, _bd = _replica_pool_stats, "replica"
 
-engine = create_async_engine(
-    ASYNC_URL,
-    echo=False,
-    pool_pre_ping=True,
-    poolclass=NullPool,      # recomendable en Render
-    connect_args={"ssl": True},  # SSL para Render (sin sslmode)
-)
+class _ReplicaQueuePool(_MedirEspera, AsyncAdaptedQueuePool):
+    _stats, _bd = _replica_pool_stats, "replica"
+
+def engine_kwargs(url: str, replica: bool = False) -> dict:
+    """
+    Opciones de create_async_engine según entorno (`replica` solo cambia dónde se cuentan las esperas).
+
+    DB_POOL_MODE=null (por defecto) -> NullPool, una conexión nueva por sesión (recomendable en Render).
+    DB_POOL_MODE=queue              -> pool persistente; se ajusta con DB_POOL_SIZE, DB_MAX_OVERFLOW,
+                                       DB_POOL_TIMEOUT, DB_POOL_RECYCLE y DB_POOL_PRE_PING.
+    """
+    kwargs: dict = {"echo": False}
+    if not url.startswith("sqlite") and _env_bool("DB_SSL", True):
+        kwargs["connect_args"] = {"ssl": True}  # SSL para Render (sin sslmode); DB_SSL=0 para un Postgres local
+
+    mode = os.getenv("DB_POOL_MODE", "null").strip().lower()
+    if mode == "null":
+        kwargs["poolclass"] = _ReplicaNullPool if replica else _TimedNullPool
+        kwargs["pool_pre_ping"] = _env_bool("DB_POOL_PRE_PING", True)
+    elif mode == "queue":
+        kwargs["poolclass"] = _ReplicaQueuePool if replica else _TimedQueuePool
+        kwargs["pool_size"] = _env_int("DB_POOL_SIZE", 5)
+        kwargs["max_overflow"] = _env_int("DB_MAX_OVERFLOW", 10)
+        kwargs["pool_timeout"] = _env_int("DB_POOL_TIMEOUT", 30)
+        kwargs["pool_recycle"] = _env_int("DB_POOL_RECYCLE", 1800)  # < idle timeout del proxy de Render
+        kwargs["pool_pre_ping"] = _env_bool("DB_POOL_PRE_PING", False)
+    else:
+        raise ValueError(f"DB_POOL_MODE inválido: '{mode}' (usa 'null' o 'queue')")
+    return kwargs
 
-AsyncSessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 Base = declarative_base()
 
-async def get_async_db() -> AsyncSession:
+# -----------------------------
+# Engine y sesiones (perezosos)
+# -----------------------------
+# Importar `database` (o `models`) no lee el entorno ni crea el engine: eso ocurre en el primer
+# get_engine(), normalmente desde el lifespan de main.py. Así scripts y workers que solo usan
+# los modelos no necesitan DATABASE_URL ni pagan la creación del engine.
+_engine: AsyncEngine | None = None
+_sessionmaker: async_sessionmaker | None = None
+_lectura_sessionmaker: async_sessionmaker | None = None  # GET/HEAD servidos por la primaria
+
+def get_engine() -> AsyncEngine:
+    global _engine, _sessionmaker, _lectura_sessionmaker
+    if _engine is None:
+        load_dotenv()  # OJO: en Render solo se usa si subiste un .env. Si no, puedes quitarlo.
+        url = normalize_asyncpg_url(os.getenv("DATABASE_URL", ""))
+        _engine = create_async_engine(url, **engine_kwargs(url))
+        _contar_conexiones(_engine, _pool_stats)
+        if url.startswith("sqlite"):
+            event.listen(_engine.sync_engine, "connect", _sqlite_foreign_keys)
+        _sessionmaker = async_sessionmaker(bind=_engine, class_=AsyncSession, expire_on_commit=False)
+        _lectura_sessionmaker = async_sessionmaker(
+            bind=_engine, class_=AsyncSession, sync_session_class=_SesionLectura, expire_on_commit=False
+        )
+    return _engine
+
+def AsyncSessionLocal(**kw) -> AsyncSession:
+    """Nueva sesión (mismo uso que el antiguo sessionmaker: `async with AsyncSessionLocal() as db`)."""
+    get_engine()
+    return _sessionmaker(**kw)
+
+async def dispose_engine() -> None:
+    global _engine, _sessionmaker, _lectura_sessionmaker, _replica_engine, _replica_sessionmaker, _replica_url
+    if _engine is not None:
+        await _engine.dispose()
+    if _replica_engine is not None:
+        await _replica_engine.dispose()
+    _engine = _sessionmaker = _lectura_sessionmaker = None
+    _replica_engine = _replica_sessionmaker = _replica_url = None
+
+# -----------------------------
+# Réplica de lectura (opcional)
+# -----------------------------
+# Con DATABASE_REPLICA_URL, los GET/HEAD que pasan por get_db leen de la réplica y todo lo demás
+# va a la primaria. La sesión sigue siendo perezosa: la conexión se abre en la primera consulta,
+# y si en ese momento la réplica no responde la sesión continúa en la primaria y no se vuelve a
+# intentar con la réplica durante REPLICA_RETRY_SECONDS. Para leer lo recién escrito (read-your-writes):
+# cabecera X-Read-Primary: 1 en la petición, o Depends(get_primary_db) en la ruta.
+READ_PRIMARY_HEADER = "x-read-primary"
+_METODOS_LECTURA = ("GET", "HEAD")
+
+_replica_engine: AsyncEngine | None = None
+_replica_sessionmaker: async_sessionmaker | None = None
+_replica_url: str | None = None  # "" = sin réplica (se lee del entorno una sola vez)
+_replica_reintento = 30.0  # REPLICA_RETRY_SECONDS, se lee junto con la URL (después de load_dotenv)
+_replica_caida_hasta = 0.0
+_replica_stats = {"lecturas_replica": 0, "lecturas_primaria": 0, "fallos_replica": 0}
+
+def get_replica_engine() -> AsyncEngine | None:
+    """Engine de la réplica, o None si no hay DATABASE_REPLICA_URL."""
+    global _replica_engine, _replica_sessionmaker, _replica_url, _replica_reintento
+    if _replica_engine is None:
+        if _replica_url is None:
+            get_engine()  # carga .env
+            _replica_url = os.getenv("DATABASE_REPLICA_URL", "").strip()
+            _replica_reintento = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+        if not _replica_url:
+            return None
+        url = normalize_asyncpg_url(_replica_url)
+        _replica_engine = create_async_engine(url, **engine_kwargs(url, replica=True))
+        _contar_conexiones(_replica_engine, _replica_pool_stats)
+        _replica_sessionmaker = async_sessionmaker(
+            bind=_replica_engine, class_=AsyncSession, sync_session_class=_SesionLectura, expire_on_commit=False
+        )
+    return _replica_engine
+
+def _replica_disponible() -> bool:
+    return get_replica_engine() is not None and time.monotonic() >= _replica_caida_hasta
+
+def _pausar_replica(e: Exception) -> None:
+    global _replica_caida_hasta
+    _replica_stats["fallos_replica"] += 1
+    _replica_caida_hasta = time.monotonic() + _replica_reintento
+    print(f"⚠ Réplica no disponible, se lee de la primaria durante {_replica_reintento:.0f}s: {e}")
+
+class _SesionLectura(Session):
+    """
+    Sesión de los GET/HEAD. Si está ligada a la réplica y la réplica no acepta la conexión (en la
+    primera consulta), pausa la réplica y sigue con la primaria sin que la petición lo note.
+    """
+    _contada = False
+
+    def _connection_for_bind(self, engine, execution_options=None, **kw):
+        if _replica_engine is not None and engine is _replica_engine.sync_engine:
+            try:
+                conn = super()._connection_for_bind(engine, execution_options, **kw)
+            except Exception as e:
+                _pausar_replica(e)
+                engine = self.bind = get_engine().sync_engine
+            else:
+                self._contar("lecturas_replica")
+                return conn
+        conn = super()._connection_for_bind(engine, execution_options, **kw)
+        self._contar("lecturas_primaria")
+        return conn
+
+    def _contar(self, clave: str) -> None:
+        if not self._contada:  # una vez por sesión, aunque haga varias transacciones
+            self._contada = True
+            _replica_stats[clave] += 1
+
+def _sesion_lectura(request: Request | None = None) -> AsyncSession:
+    """Réplica si está sana y la petición no pide la primaria; si no, la primaria."""
+    primaria = request is not None and (
+        request.headers.get(READ_PRIMARY_HEADER, "").strip().lower() in ("1", "true", "si", "sí", "yes")
+    )
+    if not primaria and _replica_disponible():
+        return _replica_sessionmaker()
+    get_engine()
+    return _lectura_sessionmaker()
+
+def replica_stats() -> dict:
+    return {
+        "configurada": get_replica_engine() is not None,
+        "disponible": _replica_disponible(),
+        **_replica_stats,
+        "pool": _pool_info(_replica_engine, _replica_pool_stats),
+    }
+
+async def warmup(conexiones: int, sentencias=()) -> int:
+    """
+    Abre `conexiones` conexiones en paralelo y ejecuta en cada una `sentencias` (p. ej. los
+    listados más usados con LIMIT 1), así el pool y la caché de sentencias preparadas de asyncpg
+    ya están llenos para la primera petición. Solo tiene sentido con DB_POOL_MODE=queue.
+    """
+    engine = get_engine()
+
+    async def una():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            for stmt in sentencias:
+                await conn.execute(stmt)
+
+    await asyncio.gather(*(una() for _ in range(conexiones)))
+    return conexiones
+
+# -----------------------------
+# Estadísticas del pool
+# -----------------------------
+def _contar_conexiones(engine: AsyncEngine, stats: dict) -> None:
+    def _on_connect(dbapi_conn, conn_record):
+        stats["connects"] += 1
+
+    def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+        stats["checkouts"] += 1
+
+    event.listen(engine.sync_engine, "connect", _on_connect)
+    event.listen(engine.sync_engine, "checkout", _on_checkout)
+
+def _sqlite_foreign_keys(dbapi_conn, conn_record):
+    # SQLite no valida las FK salvo que se active por conexión; Postgres siempre lo hace
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+def _pool_info(engine: AsyncEngine | None, stats: dict) -> dict:
+    if engine is None:
+        return {"mode": "sin iniciar", **stats}
+    pool = engine.pool
+    acquires = stats["acquires"]
+    info = {
+        "mode": "NullPool" if isinstance(pool, NullPool) else "AsyncAdaptedQueuePool",
+        "checkouts": stats["checkouts"],
+        "connects": stats["connects"],
+        "wait_avg_ms": round(stats["wait_total_ms"] / acquires, 3) if acquires else 0.0,
+        "wait_max_ms": round(stats["wait_max_ms"], 3),
+    }
+    # NullPool no expone size/overflow
+    for attr in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, attr, None)
+        if callable(fn):
+            info[attr] = fn()
+    return info
+
+def pool_stats() -> dict:
+    """Foto del pool de la primaria: conexiones prestadas, overflow y espera al adquirir conexión."""
+    return _pool_info(_engine, _pool_stats)
+
+async def abrir_sesion_lectura() -> AsyncSession:
+    """
+    Sesión de solo lectura fuera de get_db (p. ej. exportaciones), con la conexión ya abierta:
+    réplica si está configurada y responde, si no la primaria. El llamador la cierra.
+    """
+    session = _sesion_lectura()
+    try:
+        await session.connection()
+    except BaseException:
+        await session.close()
+        raise
+    return session
+
+async def get_async_db(request: Request) -> AsyncSession:
+    session = _sesion_lectura(request) if request.method in _METODOS_LECTURA else AsyncSessionLocal()
+    async with session:
+        yield session
+
+async def get_primary_db() -> AsyncSession:
+    """Para rutas GET que necesitan leer de la primaria siempre (datos recién escritos)."""
     async with AsyncSessionLocal() as session:
         yield session
 
@@ -0,0 +1,65 @@
+# etag.py
+# ETag / If-None-Match para listados. La "versión" de una tabla es una huella barata: MAX(id) y
+# MAX(fecha de cambio), cada una resuelta con un solo salto de índice (nunca un COUNT sobre toda
+# la tabla), más la generación en proceso del namespace (catalog_cache.invalidate() la sube en
+# cada escritura, también en los DELETE) y la ventana del TTL de la caché. Un DELETE hecho en
+# otro worker no mueve los máximos: como con la caché, el TTL acota cuánto puede durar un 304
+# desactualizado.
+from __future__ import annotations
+import hashlib
+import time
+from typing import Any, Optional, Tuple
+
+from fastapi import Request, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import catalog_cache
+
+async def table_fingerprint(db: AsyncSession, namespace: str, model, ts_col) -> Tuple[Any, ...]:
+    """
+    (id máximo, última modificación, generación, ventana TTL). `ts_col` debe estar indexada y
+    cambiar en cada INSERT/UPDATE de la fila (p. ej. actualizado_en).
+    """
+    # dos subconsultas escalares: cada MAX usa su índice (SQLite solo optimiza un MIN/MAX por SELECT)
+    q = await db.execute(select(
+        select(func.max(model.id)).scalar_subquery(),
+        select(func.max(ts_col)).scalar_subquery(),
+    ))
+    ventana = int(time.time() // max(catalog_cache.ttl, 1.0))
+    return (*q.one(), catalog_cache.generation(namespace), ventana)
+def make_etag(namespace: str, fingerprint: Tuple[Any, ...], request: Request) -> str:
+    # la query string entra en la huella: cada combinación de filtros/página tiene su ETag
+    raw = f"{namespace}|{fingerprint!r}|{request.url.query}"
+    return 'W/"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # comparación débil: se ignora el prefijo W/
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in if_none_match.split(","))
+
+async def check_etag(
+    db: AsyncSession,
+    request: Request,
+    response: Response,
+    namespace: str,
+    model,
+    ts_col,
+) -> Optional[Response]:
+    """
+    Calcula el ETag del listado. Si coincide con If-None-Match devuelve la respuesta 304 que el
+    handler debe retornar tal cual; si no, deja la cabecera ETag en `response` y devuelve None.
+    """
+    etag = make_etag(namespace, await table_fingerprint(db, namespace, model, ts_col), request)
+    return respond_etag(request, response, etag)
+
+def respond_etag(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Como check_etag con un ETag ya conocido (p. ej. guardado junto a la página en caché)."""
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return None
@@ -0,0 +1,89 @@
+# export.py
+# Exportación en streaming (NDJSON / CSV) con cursores del lado del servidor.
+# Las filas se leen en bloques con AsyncSession.stream() y se escriben según llegan,
+# así la memoria no depende del tamaño de la tabla.
+from __future__ import annotations
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
+
+from database import abrir_sesion_lectura
+
+CHUNK_ROWS = 1000
+FORMATOS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+def _json_default(v: Any):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return str(v)
+    raise TypeError(f"Tipo no serializable: {type(v).__name__}")
+
+def _csv_value(v: Any):
+    if v is None:
+        return ""
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, (dict, list)):
+        return json.dumps(v, default=_json_default, ensure_ascii=False)
+    return v
+
+def apply_date_range(stmt: Select, col, desde: Optional[datetime], hasta: Optional[datetime]) -> Select:
+    """Filtro [desde, hasta) sobre la columna de fecha."""
+    if desde is not None:
+        stmt = stmt.where(col >= desde)
+    if hasta is not None:
+        stmt = stmt.where(col < hasta)
+    return stmt
+
+async def _iter_rows(session: AsyncSession, stmt: Select, formato: str) -> AsyncIterator[bytes]:
+    async with session:
+        result = await session.stream(stmt.execution_options(yield_per=CHUNK_ROWS))
+        columns = list(result.keys())
+
+        if formato == "csv":
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(columns)
+            async for partition in result.partitions(CHUNK_ROWS):
+                for row in partition:
+                    writer.writerow([_csv_value(v) for v in row])
+                yield buf.getvalue().encode()
+                buf.seek(0)
+                buf.truncate(0)
+            if buf.tell():
+                yield buf.getvalue().encode()
+        else:
+            async for partition in result.partitions(CHUNK_ROWS):
+                lines = [
+                    json.dumps(dict(zip(columns, row)), default=_json_default, ensure_ascii=False)
+                    for row in partition
+                ]
+                yield ("\n".join(lines) + "\n").encode()
+
+async def stream_export(stmt: Select, formato: str, nombre: str) -> StreamingResponse:
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail="Formato no soportado (usa 'ndjson' o 'csv')")
+    ext = "ndjson" if formato == "ndjson" else "csv"
+    # Sesión propia: el generador vive más que la dependencia get_db de la petición.
+    # Exportar es solo lectura: va a la réplica si hay (DATABASE_REPLICA_URL) y responde; se abre
+    # aquí, antes de empezar la respuesta, para poder caer a la primaria si la réplica no está.
+    session = await abrir_sesion_lectura()
+    return StreamingResponse(
+        _iter_rows(session, stmt, formato),
+        media_type=FORMATOS[formato],
+        background=BackgroundTask(session.close),  # por si el cliente se va antes de la primera fila
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{ext}"'},
+    )
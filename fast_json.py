@@ -0,0 +1,80 @@
+# fast_json.py
+# Ruta rápida (opcional) para listados grandes: FAST_JSON_LISTS=1
+#
+# En lugar de cargar objetos ORM y validarlos uno a uno con response_model (from_attributes),
+# se seleccionan solo las columnas del esquema *Read como tuplas planas y se serializan
+# directamente a JSON con pydantic_core.to_json (el mismo serializador en Rust que usa Pydantic,
+# así fechas y números salen con el mismo formato). El response_model de cada ruta no cambia,
+# por lo que el esquema OpenAPI es idéntico.
+#
+# Proyección (?fields=id,nombre,valor_unitario): con o sin FAST_JSON_LISTS, el SELECT pide solo
+# esas columnas (más las claves del cursor) y la respuesta se arma con ellas, así que filas
+# leídas, memoria y tamaño del JSON bajan con las columnas que no se piden.
+from __future__ import annotations
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+from fastapi import HTTPException, Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+from sqlalchemy import Select, select
+
+FAST_JSON_LISTS = os.getenv("FAST_JSON_LISTS", "0").strip().lower() in ("1", "true", "si", "sí", "yes", "on")
+
+FIELDS_DESCRIPTION = "Columnas a devolver separadas por coma (p. ej. id,nombre,valor_unitario); por defecto todas"
+
+Fields = Optional[Tuple[str, ...]]
+
+def parse_fields(fields: Optional[str], schema: Type[BaseModel]) -> Fields:
+    """?fields= validado contra el esquema *Read, en el orden del esquema; None = todas."""
+    if not fields:
+        return None
+    pedidos = {f.strip() for f in fields.split(",") if f.strip()}
+    desconocidos = pedidos - schema.model_fields.keys()
+    if desconocidos:
+        raise HTTPException(status_code=400, detail=f"Campos desconocidos en fields: {', '.join(sorted(desconocidos))}")
+    if not pedidos:
+        return None
+    return tuple(name for name in schema.model_fields if name in pedidos)
+
+def fast_path(fields: Fields = None) -> bool:
+    """True si las filas son tuplas que se serializan aquí (ruta rápida o proyección)."""
+    return FAST_JSON_LISTS or fields is not None
+
+def list_select(model, schema: Type[BaseModel], fields: Fields = None, keys: Sequence[str] = ()) -> Select:
+    """
+    select(Model) o, en modo rápido, solo las columnas que expone el esquema. Con `fields`, solo
+    esas columnas más `keys` (las que necesita finish_page para el cursor).
+    """
+    cols = model.__table__.c
+    if fields is not None:
+        return select(*(cols[name] for name in (*fields, *(k for k in keys if k not in fields))))
+    if not FAST_JSON_LISTS:
+        return select(model)
+    return select(*(cols[name] for name in schema.model_fields))
+
+def list_rows(res, fields: Fields = None) -> List[Any]:
+    # Row admite acceso por atributo, así finish_page() funciona igual con tuplas y con ORM
+    return list(res.all()) if fast_path(fields) else list(res.scalars().all())
+
+def _as_dict(row, fields: Fields) -> Dict[str, Any]:
+    # las claves del cursor que no se pidieron no salen en la respuesta
+    return row._asdict() if fields is None else {name: getattr(row, name) for name in fields}
+
+def encode_rows(rows: Sequence[Any], fields: Fields = None) -> bytes:
+    return to_json([_as_dict(r, fields) for r in rows])
+
+def json_response(content: bytes, response: Response) -> Response:
+    # al devolver un Response propio FastAPI ignora las cabeceras del parámetro `response`
+    headers = {k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")}
+    return Response(content=content, media_type="application/json", headers=headers)
+
+def list_response(rows: Sequence[Any], response: Response, fields: Fields = None):
+    """Devuelve la lista tal cual (ruta normal) o ya serializada (ruta rápida o proyección)."""
+    if not fast_path(fields):
+        return rows
+    return json_response(encode_rows(rows, fields), response)
+
+def item_response(row, response: Response, fields: Fields) -> Response:
+    """Detalle proyectado: un solo objeto con las columnas pedidas."""
+    return json_response(to_json(_as_dict(row, fields)), response)
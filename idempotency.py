@@ -0,0 +1,237 @@
+# idempotency.py
+# Soporte de la cabecera Idempotency-Key en los POST de creación (middleware ASGI).
+#
+# La primera petición con una clave se ejecuta normalmente y su respuesta (status, cabeceras,
+# cuerpo) se guarda en una caché LRU+TTL en proceso y en la tabla claves_idempotencia, así un
+# reintento (aunque llegue a otro worker) recibe la misma respuesta sin volver a tocar compras,
+# stock ni resúmenes. Reintentos simultáneos en el mismo proceso esperan a la petición original;
+# si la original está en curso en otro worker se responde 409 con Retry-After.
+#
+# Reusar una clave con otro cuerpo es un error del cliente: 422. Las respuestas 5xx/429/503 no se
+# guardan (el reintento vuelve a ejecutarse). Limpieza de claves vencidas:
+#     python idempotency.py purge
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from cache import TTLCache
+from database import AsyncSessionLocal
+from models import ClaveIdempotencia
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+IDEMPOTENCY_LEASE = float(os.getenv("IDEMPOTENCY_LEASE", "60"))  # reserva "en curso" huérfana (worker caído)
+HEADER = b"idempotency-key"
+RUTAS = {"/compras/", "/compras/pedido", "/clientes/", "/productos/", "/categorias/", "/usuarios/"}
+NO_GUARDAR = {429, 503}  # rechazos transitorios (control de admisión): el reintento debe ejecutarse
+CABECERAS_EXCLUIDAS = {b"content-length", b"set-cookie"}
+
+# (ruta, clave) -> (huella, status, cabeceras, cuerpo)
+Respuesta = Tuple[str, int, List[List[str]], bytes]
+
+respuestas = TTLCache(maxsize=int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000")), ttl=IDEMPOTENCY_TTL)
+_en_curso: Dict[Tuple[str, str], asyncio.Future] = {}
+
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in RUTAS:
+            return await self.app(scope, receive, send)
+        clave = next((v.decode("latin-1") for k, v in scope["headers"] if k == HEADER), None)
+        if clave is None:
+            return await self.app(scope, receive, send)
+        if not clave or len(clave) > 255:
+            return await _enviar(send, 400, [["content-type", "application/json"]],
+                                 _detalle("Idempotency-Key debe tener entre 1 y 255 caracteres"))
+
+        cuerpo, receive = await _leer_cuerpo(receive)
+        huella = hashlib.sha256(cuerpo).hexdigest()
+        k = (scope["path"], clave)
+
+        # reintento concurrente en este proceso: espera a la original y repite su respuesta
+        while True:
+            guardada = respuestas.get("respuestas", k)
+            if guardada is not None:
+                return await _repetir(send, guardada, huella)
+            pendiente = _en_curso.get(k)
+            if pendiente is None:
+                break
+            await asyncio.shield(pendiente)  # si la original no guardó nada (5xx), se reintenta aquí
+
+        # sin await entre la comprobación y el registro: los duplicados que lleguen ya esperan
+        futuro = asyncio.get_running_loop().create_future()
+        _en_curso[k] = futuro
+        try:
+            guardada = await _buscar(k)  # la pudo completar otro worker
+            if guardada is not None:
+                return await _repetir(send, guardada, huella)
+            if not await _reservar(k, huella):
+                # otro worker la reservó: ya terminó (se repite) o sigue en curso (409)
+                guardada = await _buscar(k)
+                if guardada is not None:
+                    return await _repetir(send, guardada, huella)
+                return await _enviar(send, 409, [["content-type", "application/json"], ["retry-after", "1"]],
+                                     _detalle("Hay una petición con esta Idempotency-Key en curso"))
+
+            capturado: Dict[str, Any] = {"status": 500, "headers": [], "body": []}
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    capturado["status"] = message["status"]
+                    capturado["headers"] = message.get("headers", [])
+                elif message["type"] == "http.response.body":
+                    capturado["body"].append(message.get("body", b""))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                status = capturado["status"]
+                if status < 500 and status not in NO_GUARDAR:
+                    cabeceras = [
+                        [n.decode("latin-1"), v.decode("latin-1")]
+                        for n, v in capturado["headers"] if n.lower() not in CABECERAS_EXCLUIDAS
+                    ]
+                    guardada = (huella, status, cabeceras, b"".join(capturado["body"]))
+                    respuestas.set("respuestas", k, guardada)
+                    await _completar(k, guardada)
+                else:
+                    await _liberar(k)
+        finally:
+            _en_curso.pop(k, None)
+            futuro.set_result(None)
+
+# -----------------------------
+# Tabla claves_idempotencia
+# -----------------------------
+def _vigente_desde() -> datetime:
+    return datetime.now(timezone.utc) - timedelta(seconds=IDEMPOTENCY_TTL)
+
+async def _buscar(k: Tuple[str, str]) -> Optional[Respuesta]:
+    ruta, clave = k
+    async with AsyncSessionLocal() as db:
+        res = await db.execute(
+            select(ClaveIdempotencia.huella, ClaveIdempotencia.status, ClaveIdempotencia.cabeceras, ClaveIdempotencia.cuerpo)
+            .where(
+                ClaveIdempotencia.ruta == ruta,
+                ClaveIdempotencia.clave == clave,
+                ClaveIdempotencia.status.is_not(None),
+                ClaveIdempotencia.creado_en >= _vigente_desde(),
+            )
+        )
+        row = res.first()
+    if row is None:
+        return None
+    guardada = (row.huella, row.status, row.cabeceras or [], row.cuerpo or b"")
+    respuestas.set("respuestas", k, guardada)
+    return guardada
+
+async def _reservar(k: Tuple[str, str], huella: str) -> bool:
+    """INSERT de la fila 'en curso'; False si otro worker ya tiene la clave (UNIQUE clave+ruta)."""
+    ruta, clave = k
+    async with AsyncSessionLocal() as db:
+        # una clave vencida (TTL) o una reserva huérfana (LEASE) no bloquean: se borran antes
+        huerfana = datetime.now(timezone.utc) - timedelta(seconds=IDEMPOTENCY_LEASE)
+        await db.execute(delete(ClaveIdempotencia).where(
+            ClaveIdempotencia.ruta == ruta,
+            ClaveIdempotencia.clave == clave,
+            or_(
+                ClaveIdempotencia.creado_en < _vigente_desde(),
+                and_(ClaveIdempotencia.status.is_(None), ClaveIdempotencia.creado_en < huerfana),
+            ),
+        ))
+        try:
+            await db.execute(insert(ClaveIdempotencia).values(clave=clave, ruta=ruta, huella=huella))
+            await db.commit()
+            return True
+        except IntegrityError:
+            await db.rollback()
+            return False
+
+async def _completar(k: Tuple[str, str], guardada: Respuesta) -> None:
+    ruta, clave = k
+    _, status, cabeceras, cuerpo = guardada
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(ClaveIdempotencia)
+            .where(ClaveIdempotencia.ruta == ruta, ClaveIdempotencia.clave == clave)
+            .values(status=status, cabeceras=cabeceras, cuerpo=cuerpo)
+        )
+        await db.commit()
+
+async def _liberar(k: Tuple[str, str]) -> None:
+    ruta, clave = k
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(ClaveIdempotencia).where(
+            ClaveIdempotencia.ruta == ruta, ClaveIdempotencia.clave == clave
+        ))
+        await db.commit()
+
+async def purgar() -> int:
+    async with AsyncSessionLocal() as db:
+        res = await db.execute(delete(ClaveIdempotencia).where(ClaveIdempotencia.creado_en < _vigente_desde()))
+        await db.commit()
+        return res.rowcount
+
+# -----------------------------
+# ASGI
+# -----------------------------
+async def _leer_cuerpo(receive):
+    partes = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        partes.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    cuerpo = b"".join(partes)
+    entregado = False
+
+    async def receive_repetido():
+        # la app recibe el cuerpo ya leído; después, los mensajes originales (desconexión)
+        nonlocal entregado
+        if not entregado:
+            entregado = True
+            return {"type": "http.request", "body": cuerpo, "more_body": False}
+        return await receive()
+
+    return cuerpo, receive_repetido
+
+def _detalle(texto: str) -> bytes:
+    return json.dumps({"detail": texto}).encode()
+
+async def _repetir(send, guardada: Respuesta, huella: str) -> None:
+    huella_original, status, cabeceras, cuerpo = guardada
+    if huella != huella_original:
+        return await _enviar(send, 422, [["content-type", "application/json"]],
+                             _detalle("Idempotency-Key ya usada con un cuerpo distinto"))
+    await _enviar(send, status, cabeceras + [["idempotent-replayed", "true"]], cuerpo)
+
+async def _enviar(send, status: int, cabeceras: List[List[str]], cuerpo: bytes) -> None:
+    headers = [(n.encode("latin-1"), v.encode("latin-1")) for n, v in cabeceras]
+    headers.append((b"content-length", str(len(cuerpo)).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": cuerpo})
+
+async def _main(argv: List[str]) -> None:
+    from database import dispose_engine
+
+    if argv[1:] != ["purge"]:
+        print("uso: python idempotency.py purge")
+        sys.exit(2)
+    n = await purgar()
+    await dispose_engine()
+    print(f"✔ claves de idempotencia vencidas eliminadas: {n}")
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv))
@@ -1,7 +1,26 @@
 # main.py
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
+from database import get_engine, get_replica_engine, dispose_engine, warmup, pool_stats, replica_stats
+from search import setup_search
+from cache import catalog_cache
+from audit import audit_queue
+import passwords
+import retention
+from admission import AdmissionMiddleware, admission_control
+from idempotency import IdempotencyMiddleware, respuestas as idempotency_cache
+from metrics import MetricsMiddleware, instrument_engine, register_gauges, render as render_metrics
+from fast_json import list_select
+from pagination import PageParams, paginate_by_id, paginate_by_time
+from models import Categoria, Compra, Producto
+import schemas
+
 # ✅ Importa routers (asegúrate de que existan en /routers)
 from routers.router_usuario import router as usuarios_router
 from routers.router_producto import router as productos_router
@@ -9,6 +28,55 @@ from routers.router_cliente import router as clientes_router
 from routers.router_compra import router as compras_router
 from routers.router_categoria import router as categorias_router  # 👈 sin 's'
 from routers.router_historial import router as historial_router
+from routers.router_reportes import router as reportes_router
+
+# ✅ Arranque / apagado (lifespan)
+# El engine se crea aquí y no al importar database.py. DB_WARMUP_CONNECTIONS=N (con
+# DB_POOL_MODE=queue) abre N conexiones y prepara las consultas de los listados más usados.
+def _sentencias_calientes():
+    page = PageParams(limit=1, cursor=None)  # mismo SQL que la primera página de cada listado
+    return [
+        paginate_by_id(list_select(Producto, schemas.ProductoRead), Producto.id, page),
+        paginate_by_id(list_select(Categoria, schemas.CategoriaRead), Categoria.id, page),
+        paginate_by_time(list_select(Compra, schemas.CompraRead), Compra.creado_en, Compra.id, page),
+    ]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    engine = get_engine()
+    instrument_engine(engine.sync_engine)
+    replica = get_replica_engine()
+    if replica is not None:
+        instrument_engine(replica.sync_engine)
+
+    # ✅ Índices de búsqueda (pg_trgm / FTS5), idempotente
+    try:
+        async with engine.begin() as conn:
+            await setup_search(conn)
+    except Exception as e:
+        print("⚠ No se pudieron preparar los índices de búsqueda:", e)
+
+    # ✅ Particiones mensuales del historial para los próximos meses (solo si está particionada),
+    # al arrancar y luego periódicamente mientras la app siga en marcha
+    particiones = None
+    if engine.dialect.name == "postgresql":
+        particiones = asyncio.create_task(retention.mantener_particiones(engine), name="particiones-historial")
+
+    conexiones = int(os.getenv("DB_WARMUP_CONNECTIONS", "0"))
+    if conexiones > 0:
+        try:
+            await warmup(conexiones, _sentencias_calientes())
+        except Exception as e:
+            print("⚠ Warm-up de conexiones fallido:", e)
+
+    # ✅ Historial de eliminados: escritor en segundo plano
+    audit_queue.start()
+    yield
+    if particiones is not None:
+        particiones.cancel()
+    await audit_queue.close()  # escribe lo pendiente antes de salir
+    await dispose_engine()
+    passwords.shutdown()
 
 # ✅ Inicialización de la app
 app = FastAPI(
@@ -18,8 +86,16 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
+    lifespan=lifespan,
 )
 
+# ✅ Idempotency-Key en los POST de creación (reintentos de los POS sin duplicar ventas)
+app.add_middleware(IdempotencyMiddleware)
+
+# ✅ Control de admisión: límite de concurrencia + cola corta + rate limit por cliente (429/503).
+# Se registra antes que CORS para que los rechazos también lleven las cabeceras CORS.
+app.add_middleware(AdmissionMiddleware)
+
 # ✅ Middleware CORS (ajústalo según tu dominio)
 app.add_middleware(
     CORSMiddleware,
@@ -27,8 +103,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Idempotent-Replayed"],  # cursor / caché HTTP / reintentos
 )
 
+# ✅ Métricas Prometheus: latencia por ruta (middleware) y por sentencia SQL (eventos del engine)
+app.add_middleware(MetricsMiddleware)
+register_gauges("db_pool", "Estado del pool de conexiones", pool_stats)
+register_gauges("db_replica", "Lecturas enrutadas a la réplica / primaria", replica_stats)
+register_gauges("db_replica_pool", "Estado del pool de la réplica", lambda: replica_stats()["pool"])
+register_gauges("catalog_cache", "Caché del catálogo", catalog_cache.stats)
+register_gauges("audit_queue", "Cola de historial de eliminados", audit_queue.stats)
+register_gauges("idempotency_cache", "Respuestas guardadas por Idempotency-Key", idempotency_cache.stats)
+register_gauges("admission", "Control de admisión (concurrencia y rechazos)", admission_control.stats)
+
 # ✅ Health endpoints
 @app.get("/", tags=["Health"])
 async def root():
@@ -38,6 +125,30 @@ async def root():
 async def health():
     return {"ok": True}
 
+@app.get("/health/pool", tags=["Health"])
+async def health_pool():
+    # útil para dimensionar DB_POOL_SIZE / DB_MAX_OVERFLOW
+    return {**pool_stats(), "replica": replica_stats()}
+
+@app.get("/health/cache", tags=["Health"])
+async def health_cache():
+    # hits/misses de la caché del catálogo (categorías y productos)
+    return catalog_cache.stats()
+
+@app.get("/health/audit", tags=["Health"])
+async def health_audit():
+    # cola de historial pendiente / escrito / descartado
+    return audit_queue.stats()
+
+@app.get("/health/admission", tags=["Health"])
+async def health_admission():
+    # peticiones en curso / en cola / rechazadas con 429 y 503
+    return admission_control.stats()
+
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # ✅ Montar todos los routers
 app.include_router(usuarios_router)
 app.include_router(productos_router)
@@ -45,16 +156,16 @@ app.include_router(clientes_router)
 app.include_router(compras_router)
 app.include_router(categorias_router)
 app.include_router(historial_router)
+app.include_router(reportes_router)
 
 # ✅ (Opcional) Crear tablas automáticamente al iniciar
-# Descomenta este bloque solo si tu database.py expone `engine` y `Base`
+# Descomenta este bloque y llámalo desde lifespan() si quieres crear las tablas al arrancar
 """
-from database import engine, Base
+from database import Base
 
-@app.on_event("startup")
-async def startup_event():
+async def crear_tablas():
     try:
-        async with engine.begin() as conn:
+        async with get_engine().begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
         print("✔ Tablas creadas correctamente.")
     except Exception as e:
@@ -0,0 +1,179 @@
+# metrics.py
+# Métricas en formato de texto de Prometheus, sin dependencias extra:
+#  - MetricsMiddleware (ASGI): latencia por ruta, peticiones en curso y códigos de estado.
+#  - instrument_engine(): eventos de SQLAlchemy con latencia por sentencia (operación/tabla),
+#    filas afectadas y log de consultas lentas (SLOW_QUERY_MS).
+# GET /metrics (main.py) devuelve render().
+from __future__ import annotations
+import logging
+import os
+import re
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+slow_log = logging.getLogger("sql.slow")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.values: Dict[Labels, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        self.values[tuple(sorted(labels.items()))] += amount
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        out += [f"{self.name}{_fmt_labels(k)} {v}" for k, v in self.values.items()]
+        return out
+
+class Gauge(Counter):
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        self.values[tuple(sorted(labels.items()))] = value
+
+    def render(self) -> List[str]:
+        out = super().render()
+        out[1] = f"# TYPE {self.name} gauge"
+        return out
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help = name, help
+        self.buckets = tuple(buckets)
+        # por etiquetas: [conteos por bucket..., +Inf], suma
+        self.values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        counts, total = self.values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in self.values.items():
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                out.append(f"{self.name}_bucket{_fmt_labels(key, ('le', repr(float(le))))} {acc}")
+            acc += counts[-1]
+            out.append(f"{self.name}_bucket{_fmt_labels(key, ('le', '+Inf'))} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(key)} {total[0]}")
+            out.append(f"{self.name}_count{_fmt_labels(key)} {acc}")
+        return out
+
+# -----------------------------
+# Métricas HTTP
+# -----------------------------
+http_latency = Histogram("http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta")
+http_requests = Counter("http_requests_total", "Peticiones HTTP por ruta, método y código")
+http_in_flight = Gauge("http_requests_in_flight", "Peticiones HTTP en curso")
+
+class MetricsMiddleware:
+    """Middleware ASGI puro (no envuelve el cuerpo, así no rompe StreamingResponse)."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - t0
+            http_in_flight.dec()
+            # plantilla de la ruta (/productos/{producto_id}), no la URL: cardinalidad acotada
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "sin_ruta"
+            method = scope.get("method", "")
+            http_latency.observe(elapsed, route=path, method=method)
+            http_requests.inc(route=path, method=method, status=str(status["code"]))
+
+# -----------------------------
+# Métricas SQL
+# -----------------------------
+sql_latency = Histogram("db_statement_duration_seconds", "Latencia por sentencia SQL (operación/tabla)")
+# solo INSERT/UPDATE/DELETE: en un SELECT el rowcount del driver es -1 o 0, no las filas leídas
+sql_rows = Histogram("db_statement_rows_affected", "Filas afectadas por INSERT/UPDATE/DELETE (cuando el driver lo informa)", ROW_BUCKETS)
+sql_slow = Counter("db_slow_statements_total", "Sentencias más lentas que SLOW_QUERY_MS")
+db_acquire = Histogram("db_connection_acquire_seconds", "Espera para obtener conexión del pool (bd=primaria/replica)")
+
+_TABLA_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+\"?(\w+)", re.IGNORECASE)
+
+def _describe(statement: str) -> Tuple[str, str]:
+    op = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "?"
+    m = _TABLA_RE.search(statement)
+    return op, (m.group(1) if m else "-")
+
+def instrument_engine(sync_engine) -> None:
+    if getattr(sync_engine, "_metrics_instrumented", False):
+        return  # el lifespan puede correr más de una vez sobre el mismo engine (tests, benchmark)
+    sync_engine._metrics_instrumented = True
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_t0 = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_t0
+        op, tabla = _describe(statement)
+        sql_latency.observe(elapsed, op=op, tabla=tabla)
+        rowcount = getattr(cursor, "rowcount", -1)
+        es_dml = context is not None and (context.isinsert or context.isupdate or context.isdelete)
+        if es_dml and rowcount is not None and rowcount >= 0:
+            sql_rows.observe(rowcount, op=op, tabla=tabla)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            sql_slow.inc(op=op, tabla=tabla)
+            slow_log.warning("consulta lenta (%.1f ms): %s", elapsed * 1000, " ".join(statement.split())[:500])
+
+# -----------------------------
+# Exposición
+# -----------------------------
+_collectors = [http_latency, http_requests, http_in_flight, sql_latency, sql_rows, sql_slow, db_acquire]
+_extra_gauges: List[Tuple[str, str, Callable[[], Dict[str, float]]]] = []
+
+def register_gauges(prefix: str, help: str, fn: Callable[[], Dict[str, float]]) -> None:
+    """Publica como gauges `<prefix>_<clave>` los valores numéricos que devuelve `fn` al hacer scrape."""
+    _extra_gauges.append((prefix, help, fn))
+
+def render() -> str:
+    lines: List[str] = []
+    for c in _collectors:
+        lines += c.render()
+    for prefix, help, fn in _extra_gauges:
+        for k, v in fn().items():
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                lines += [f"# HELP {prefix}_{k} {help}", f"# TYPE {prefix}_{k} gauge", f"{prefix}_{k} {v}"]
+    return "\n".join(lines) + "\n"
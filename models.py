@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Index, JSON, LargeBinary, UniqueConstraint, func, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import JSONB
 from database import Base
@@ -44,13 +44,17 @@ class Categoria(Base):
     __tablename__ = "categorias"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    nombre = Column(String(120), nullable=False, index=True)
+    nombre = Column(String(120), nullable=False, unique=True, index=True)
     codigo = Column(String(30), nullable=True, index=True)
     creado_en = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     actualizado_en = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now(), nullable=False)
 
     productos = relationship("Producto", back_populates="categoria")
 
+    __table_args__ = (
+        Index("ix_categorias_actualizado", "actualizado_en"),  # MAX() del ETag
+    )
+
 # -----------------------------
 # MODELO: PRODUCTO
 # -----------------------------
@@ -61,14 +65,28 @@ class Producto(Base):
     nombre = Column(String(120), nullable=False, index=True)
     descripcion = Column(String(250))
     cantidad = Column(Integer, nullable=False, default=0)
+    stock_minimo = Column(Integer, nullable=False, default=0, server_default="0")  # umbral de reposición
     valor_unitario = Column(Float, nullable=False)
     valor_mayorista = Column(Float, nullable=True)
     categoria_id = Column(Integer, ForeignKey("categorias.id"))
     creado_en = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    actualizado_en = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now(), nullable=False)
 
     categoria = relationship("Categoria", back_populates="productos")
     compras = relationship("Compra", back_populates="producto")
 
+    __table_args__ = (
+        # índice parcial: solo contiene los productos bajo su umbral; la BD lo mantiene en cada
+        # UPDATE de cantidad/stock_minimo, así /productos/bajo-stock no recorre el catálogo
+        Index(
+            "ix_productos_bajo_stock",
+            "id",
+            postgresql_where=text("cantidad <= stock_minimo"),
+            sqlite_where=text("cantidad <= stock_minimo"),
+        ),
+        Index("ix_productos_actualizado", "actualizado_en"),  # MAX() del ETag
+    )
+
 # -----------------------------
 # MODELO: COMPRA
 # -----------------------------
@@ -78,6 +96,9 @@ class Compra(Base):
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     cliente_id = Column(Integer, ForeignKey("clientes.id"))
     producto_id = Column(Integer, ForeignKey("productos.id"))
+    # categoría del producto al momento de la venta (dato histórico, sin FK): al eliminar la
+    # compra los resúmenes se descuentan de la misma categoría en que se sumaron
+    categoria_id = Column(Integer, nullable=True)
     cantidad = Column(Integer, nullable=False)
     total = Column(Float, nullable=False)
     creado_en = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -85,6 +106,14 @@ class Compra(Base):
     cliente = relationship("Cliente", back_populates="compras")
     producto = relationship("Producto", back_populates="compras")
 
+    __table_args__ = (
+        # keyset de /compras (creado_en DESC, id DESC) y MAX(creado_en) del ETag
+        Index("ix_compras_creado", "creado_en", "id"),
+        # el UPDATE ... SET fk = NULL de delete_returning y la comprobación de FK al borrar clientes/productos
+        Index("ix_compras_cliente", "cliente_id"),
+        Index("ix_compras_producto", "producto_id"),
+    )
+
 # -----------------------------
 # HISTORIAL DE ELIMINADOS
 # -----------------------------
@@ -94,10 +123,54 @@ class HistorialEliminados(Base):
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     tabla = Column(String(50), nullable=False)
     registro_id = Column(Integer, nullable=False)
-    datos = Column(JSONB, nullable=False, default=dict)  # snapshot en JSONB
+    # JSONB en PostgreSQL; JSON (texto) en SQLite para pruebas/benchmarks locales
+    datos = Column(JSON().with_variant(JSONB, "postgresql"), nullable=False, default=dict)
     eliminado_en = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
+    __table_args__ = (
+        # /historial/eliminados por tabla, ordenado por fecha (keyset eliminado_en, id)
+        Index("ix_historial_tabla_eliminado", "tabla", "eliminado_en", "id"),
+        Index("ix_historial_eliminado", "eliminado_en", "id"),
+    )
 
+# -----------------------------
+# RESUMEN DE VENTAS (pre-agregado, ver rollups.py)
+# -----------------------------
+class ResumenVentas(Base):
+    __tablename__ = "resumen_ventas"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    periodo = Column(String(1), nullable=False)       # "D" diario / "M" mensual
+    fecha = Column(Date, nullable=False)              # día, o primer día del mes
+    dimension = Column(String(20), nullable=False)    # producto / categoria / cliente / total
+    clave = Column(Integer, nullable=False)           # id según la dimensión (0 = total / sin valor)
+    unidades = Column(Integer, nullable=False, default=0)
+    ingresos = Column(Float, nullable=False, default=0)
+    compras = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("periodo", "fecha", "dimension", "clave", name="uq_resumen_ventas"),
+        Index("ix_resumen_ventas_consulta", "periodo", "dimension", "clave", "fecha"),
+        # reportes sin clave (todas las claves, y "total"): rango de fechas, más reciente primero
+        Index("ix_resumen_ventas_fecha", "periodo", "dimension", "fecha", "clave"),
+    )
 
+# -----------------------------
+# CLAVES DE IDEMPOTENCIA (ver idempotency.py)
+# -----------------------------
+class ClaveIdempotencia(Base):
+    __tablename__ = "claves_idempotencia"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    clave = Column(String(255), nullable=False)        # cabecera Idempotency-Key
+    ruta = Column(String(200), nullable=False)         # POST /compras/, /compras/pedido, ...
+    huella = Column(String(64), nullable=False)        # sha256 del cuerpo de la petición
+    status = Column(Integer, nullable=True)            # NULL = petición en curso
+    cabeceras = Column(JSON, nullable=True)
+    cuerpo = Column(LargeBinary, nullable=True)
+    creado_en = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
-
+    __table_args__ = (
+        UniqueConstraint("clave", "ruta", name="uq_claves_idempotencia"),
+        Index("ix_claves_idempotencia_creado", "creado_en"),
+    )
@@ -0,0 +1,114 @@
+# pagination.py
+# Paginación por cursor (keyset) común a todos los listados.
+# El cuerpo de la respuesta sigue siendo una lista; el cursor de la siguiente página
+# viaja en la cabecera X-Next-Cursor (vacía/ausente cuando no hay más resultados).
+import base64
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import DateTime, Select, String, and_, literal, or_
+from sqlalchemy.types import TypeDecorator
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+class PageParams:
+    """Dependencia FastAPI: ?limit=&cursor="""
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT, description="Máximo de filas por página"),
+        cursor: Optional[str] = Query(None, description="Valor de X-Next-Cursor de la página anterior"),
+    ):
+        self.limit = limit
+        self.cursor = cursor
+
+def encode_cursor(*values: Any) -> str:
+    raw = [v.isoformat() if isinstance(v, date) else v for v in values]  # date y datetime
+    data = json.dumps(raw, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list):
+            raise ValueError
+        return values
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+class _FechaCursor(TypeDecorator):
+    """
+    Fecha del cursor al compararla con la columna. En SQLite las fechas son texto y se comparan
+    como texto: CURRENT_TIMESTAMP (server_default) guarda 'YYYY-MM-DD HH:MM:SS' y SQLAlchemy
+    'YYYY-MM-DD HH:MM:SS.ffffff', así que el valor se liga con el formato que tenía la fila.
+    """
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(String())
+        return dialect.type_descriptor(DateTime(timezone=True))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != "sqlite":
+            return value
+        return value.strftime("%Y-%m-%d %H:%M:%S" if value.microsecond == 0 else "%Y-%m-%d %H:%M:%S.%f")
+
+def paginate_by_id(stmt: Select, id_col, page: PageParams) -> Select:
+    """Orden ascendente por id; la página siguiente empieza después del último id."""
+    if page.cursor:
+        values = decode_cursor(page.cursor)
+        if len(values) != 1 or not isinstance(values[0], int):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        stmt = stmt.where(id_col > values[0])
+    return stmt.order_by(id_col.asc()).limit(page.limit + 1)
+
+def paginate_by_time(stmt: Select, time_col, id_col, page: PageParams) -> Select:
+    """Orden descendente por (fecha, id): lo más reciente primero, id desempata."""
+    if page.cursor:
+        values = decode_cursor(page.cursor)
+        try:
+            ts, last_id = datetime.fromisoformat(values[0]), int(values[1])
+        except (IndexError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        ts = literal(ts, _FechaCursor())
+        stmt = stmt.where(or_(time_col < ts, and_(time_col == ts, id_col < last_id)))
+    return stmt.order_by(time_col.desc(), id_col.desc()).limit(page.limit + 1)
+
+def paginate_by_date(stmt: Select, date_col, key_col, page: PageParams) -> Select:
+    """
+    Como paginate_by_time para columnas Date (sin hora): descendente por (fecha, clave).
+    Sin key_col la fecha sola es única (p. ej. una fila agregada por día) y el cursor es [fecha].
+    """
+    if page.cursor:
+        values = decode_cursor(page.cursor)
+        try:
+            dia = date.fromisoformat(values[0])
+            last_key = int(values[1]) if key_col is not None else None
+            if key_col is None and len(values) != 1:
+                raise ValueError
+        except (IndexError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        if key_col is None:
+            stmt = stmt.where(date_col < dia)
+        else:
+            stmt = stmt.where(or_(date_col < dia, and_(date_col == dia, key_col < last_key)))
+    orden = (date_col.desc(),) if key_col is None else (date_col.desc(), key_col.desc())
+    return stmt.order_by(*orden).limit(page.limit + 1)
+
+def finish_page(rows: Sequence[Any], page: PageParams, response: Response, *keys: str) -> List[Any]:
+    """
+    Recorta la fila extra pedida por paginate_* y publica el cursor siguiente.
+    `keys` son los atributos que forman el cursor (p. ej. "id" o "creado_en", "id").
+    """
+    rows = list(rows)
+    if len(rows) > page.limit:
+        rows = rows[: page.limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*(getattr(last, k) for k in keys))
+    return rows
@@ -0,0 +1,100 @@
+# passwords.py
+# Hash de contraseñas con scrypt (hashlib, memory-hard, sin dependencias extra).
+#
+# scrypt tarda decenas de ms y usa 128·N·r bytes de memoria por llamada, así que nunca corre en
+# el event loop: va a un ThreadPoolExecutor propio y acotado (hashlib libera el GIL durante el
+# cálculo, el resto de endpoints sigue atendiendo). Un semáforo limita además las llamadas en
+# espera, para que una ráfaga de altas/logins no acumule trabajo (ni memoria) sin límite.
+#
+# Formato guardado en Usuario.contraseña:  scrypt$<N>$<r>$<p>$<sal b64>$<hash b64>
+# Si los parámetros cambian (PASSWORD_SCRYPT_*) o el valor es una contraseña antigua en claro,
+# verify_password() indica que hay que re-hashear, y el login lo hace de forma transparente.
+from __future__ import annotations
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))  # 16 MiB con r=8
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(HASH_WORKERS * 8)))
+
+PREFIJO = "scrypt"
+SAL_BYTES = 16
+HASH_BYTES = 32
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pendientes: Optional[asyncio.Semaphore] = None
+
+def _b64(b: bytes) -> str:
+    return base64.urlsafe_b64encode(b).decode().rstrip("=")
+
+def _unb64(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+def _scrypt(plain: str, sal: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        plain.encode("utf-8"), salt=sal, n=n, r=r, p=p, dklen=HASH_BYTES,
+        maxmem=256 * n * r * p,  # el default de OpenSSL (32 MiB) no alcanza para N grandes
+    )
+
+def _hash_sync(plain: str) -> str:
+    sal = os.urandom(SAL_BYTES)
+    digest = _scrypt(plain, sal, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"{PREFIJO}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(sal)}${_b64(digest)}"
+
+def _verify_sync(plain: str, stored: str) -> Tuple[bool, bool]:
+    """(coincide, hay que re-hashear)"""
+    partes = stored.split("$")
+    if len(partes) != 6 or partes[0] != PREFIJO:
+        # contraseña guardada en claro (anterior al hash): se acepta una vez y se migra
+        return hmac.compare_digest(plain.encode("utf-8"), stored.encode("utf-8")), True
+    _, n, r, p, sal, digest = partes
+    try:
+        n, r, p = int(n), int(r), int(p)
+        ok = hmac.compare_digest(_scrypt(plain, _unb64(sal), n, r, p), _unb64(digest))
+    except (ValueError, OverflowError):
+        # hash guardado corrupto (parámetros o base64 inválidos): login fallido, no un 500
+        return False, False
+    return ok, (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+async def _run(fn, *args):
+    global _executor, _pendientes
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+        _pendientes = asyncio.Semaphore(HASH_MAX_PENDING)
+    async with _pendientes:  # backpressure: como mucho HASH_MAX_PENDING llamadas en cola/ejecución
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+async def hash_password(plain: str) -> str:
+    return await _run(_hash_sync, plain)
+
+async def verify_password(plain: str, stored: str) -> Tuple[bool, Optional[str]]:
+    """
+    Devuelve (coincide, nuevo_hash). nuevo_hash no es None cuando la contraseña es correcta pero
+    está guardada con otros parámetros (o en claro): el llamador debe persistirlo.
+    """
+    ok, rehash = await _run(_verify_sync, plain, stored)
+    if ok and rehash:
+        return True, await hash_password(plain)
+    return ok, None
+
+_HASH_FICTICIO: Optional[str] = None
+
+async def verify_dummy(plain: str) -> None:
+    """Mismo costo que una verificación real, para que un correo inexistente no se note en el tiempo."""
+    global _HASH_FICTICIO
+    if _HASH_FICTICIO is None:
+        _HASH_FICTICIO = await hash_password("")
+    await verify_password(plain, _HASH_FICTICIO)
+
+def shutdown() -> None:
+    global _executor, _pendientes
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+    _executor = _pendientes = None
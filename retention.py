@@ -0,0 +1,249 @@
+# retention.py
+# Mantenimiento de historial_eliminados:
+#
+#   python retention.py archive [--dias 365] [--dir archivo_historial]
+#       Exporta a NDJSON comprimido (gzip) los registros más antiguos que --dias y los elimina.
+#       Si la tabla está particionada, archiva y elimina particiones mensuales completas (DROP).
+#
+#   python retention.py partition [--meses 3] [--migrate]
+#       (Solo PostgreSQL) Crea las particiones mensuales de los próximos --meses.
+#       Con --migrate convierte antes la tabla normal en una particionada por RANGE (eliminado_en).
+#
+# Las particiones de los próximos HISTORIAL_PARTICIONES_ADELANTE meses también se crean en cada
+# archive y, con la app en marcha, cada HISTORIAL_PARTICIONES_CADA segundos (mantener_particiones).
+# Una partición DEFAULT recoge lo que caiga fuera de ellas: un INSERT del historial nunca falla
+# por no tener partición. Si la DEFAULT ya tiene filas de un mes, al crear ese mes se mueven a su
+# partición, y archive también archiva las filas viejas de la DEFAULT.
+from __future__ import annotations
+import argparse
+import asyncio
+import gzip
+import json
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from models import HistorialEliminados
+
+TABLA = HistorialEliminados.__tablename__
+RETENCION_DIAS = int(os.getenv("HISTORIAL_RETENCION_DIAS", "365"))
+ARCHIVO_DIR = os.getenv("HISTORIAL_ARCHIVO_DIR", "archivo_historial")
+PARTICIONES_ADELANTE = int(os.getenv("HISTORIAL_PARTICIONES_ADELANTE", "3"))
+PARTICIONES_CADA = float(os.getenv("HISTORIAL_PARTICIONES_CADA", str(6 * 3600)))
+DEFAULT = f"{TABLA}_default"
+CHUNK_ROWS = 5000
+
+def _json_default(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(v).__name__}")
+
+def _mes(d: date, delta: int = 0) -> date:
+    m = d.month - 1 + delta
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+def _nombre_particion(inicio: date) -> str:
+    return f"{TABLA}_y{inicio.year}m{inicio.month:02d}"
+
+def _rango(inicio: date) -> str:
+    # mismo literal que los límites de la partición, así filtro y límites se interpretan igual
+    return f"eliminado_en >= '{inicio.isoformat()}' AND eliminado_en < '{_mes(inicio, 1).isoformat()}'"
+
+async def _existe(conn: AsyncConnection, nombre: str) -> bool:
+    return (await conn.execute(text("SELECT to_regclass(:n)"), {"n": nombre})).scalar() is not None
+
+async def _es_particionada(conn: AsyncConnection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    q = await conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :t"),
+        {"t": TABLA},
+    )
+    return q.first() is not None
+
+async def _exportar(conn: AsyncConnection, stmt, ruta: str) -> Tuple[int, Optional[int]]:
+    """Escribe las filas de `stmt` en `ruta` (gzip NDJSON). Devuelve (filas, id máximo)."""
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    n, max_id = 0, None
+    tmp = ruta + ".tmp"
+    result = await conn.stream(stmt.execution_options(yield_per=CHUNK_ROWS))
+    columns = list(result.keys())
+    with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+        async for partition in result.partitions(CHUNK_ROWS):
+            for row in partition:
+                d = dict(zip(columns, row))
+                fh.write(json.dumps(d, default=_json_default, ensure_ascii=False) + "\n")
+                n += 1
+                max_id = d["id"] if max_id is None else max(max_id, d["id"])
+        fh.flush()
+        os.fsync(fh.fileno())
+    # solo se borra de la BD si el archivo quedó completo en disco
+    os.replace(tmp, ruta)
+    return n, max_id
+
+async def archivar(conn: AsyncConnection, dias: int = RETENCION_DIAS, directorio: str = ARCHIVO_DIR) -> List[str]:
+    """Archiva y elimina lo anterior a `dias`. Devuelve las rutas de los archivos creados."""
+    corte = datetime.now(timezone.utc) - timedelta(days=dias)
+    sello = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    archivos: List[str] = []
+
+    if await _es_particionada(conn):
+        await crear_particiones(conn, PARTICIONES_ADELANTE)
+        # particiones cuyo rango termina antes del corte: se archivan enteras y se eliminan (DROP)
+        q = await conn.execute(text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :t ORDER BY c.relname"
+        ), {"t": TABLA})
+        for nombre, _ in q.all():
+            try:
+                inicio = datetime.strptime(nombre.rsplit("_", 1)[1], "y%Ym%m").date()
+            except (IndexError, ValueError):
+                continue  # partición que no sigue el esquema mensual (p. ej. default)
+            if _mes(inicio, 1) > corte.date():
+                continue
+            ruta = os.path.join(directorio, f"{nombre}_{sello}.ndjson.gz")
+            await _exportar(conn, select(text("*")).select_from(text(nombre)), ruta)
+            await conn.execute(text(f"DROP TABLE {nombre}"))
+            await conn.commit()
+            archivos.append(ruta)
+        # filas viejas que cayeron en la DEFAULT (fuera de toda partición mensual): fila a fila
+        if await _existe(conn, DEFAULT):
+            viejos = select(text("*")).select_from(text(DEFAULT)).where(text("eliminado_en < :corte"))
+            ruta = os.path.join(directorio, f"{DEFAULT}_{sello}.ndjson.gz")
+            n, max_id = await _exportar(conn, viejos.params(corte=corte).order_by(text("id")), ruta)
+            if n == 0:
+                os.remove(ruta)
+            else:
+                await conn.execute(
+                    text(f"DELETE FROM {DEFAULT} WHERE eliminado_en < :corte AND id <= :max_id"),
+                    {"corte": corte, "max_id": max_id},
+                )
+                await conn.commit()
+                archivos.append(ruta)
+        return archivos
+
+    viejos = select(*HistorialEliminados.__table__.c).where(HistorialEliminados.eliminado_en < corte)
+    ruta = os.path.join(directorio, f"{TABLA}_{sello}.ndjson.gz")
+    n, max_id = await _exportar(conn, viejos.order_by(HistorialEliminados.id), ruta)
+    if n == 0:
+        os.remove(ruta)
+        return archivos
+    await conn.execute(
+        delete(HistorialEliminados).where(
+            HistorialEliminados.eliminado_en < corte, HistorialEliminados.id <= max_id
+        )
+    )
+    await conn.commit()
+    archivos.append(ruta)
+    return archivos
+
+async def crear_particiones(
+    conn: AsyncConnection, meses: int = 3, desde: Optional[date] = None, commit: bool = True
+) -> List[str]:
+    """Crea (si faltan) las particiones mensuales desde `desde` hasta `meses` por delante de hoy, y la DEFAULT."""
+    hoy = datetime.now(timezone.utc).date()
+    inicio = _mes(desde or hoy)
+    fin = _mes(hoy, meses + 1)
+    creadas = []
+    while inicio < fin:
+        nombre = _nombre_particion(inicio)
+        if not await _existe(conn, nombre):
+            await _crear_mes(conn, nombre, inicio)
+        creadas.append(nombre)
+        inicio = _mes(inicio, 1)
+    await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT} PARTITION OF {TABLA} DEFAULT"))
+    if commit:
+        await conn.commit()
+    return creadas
+
+async def _crear_mes(conn: AsyncConnection, nombre: str, inicio: date) -> None:
+    limites = f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{_mes(inicio, 1).isoformat()}')"
+    en_default = await _existe(conn, DEFAULT) and (
+        await conn.execute(text(f"SELECT 1 FROM {DEFAULT} WHERE {_rango(inicio)} LIMIT 1"))
+    ).first() is not None
+    if not en_default:
+        await conn.execute(text(f"CREATE TABLE {nombre} PARTITION OF {TABLA} {limites}"))
+        return
+    # Postgres rechaza la partición nueva si la DEFAULT ya tiene filas de ese rango: se separa la
+    # DEFAULT, se crea el mes, se le pasan sus filas y se vuelve a adjuntar (en la misma transacción)
+    await conn.execute(text(f"ALTER TABLE {TABLA} DETACH PARTITION {DEFAULT}"))
+    await conn.execute(text(f"CREATE TABLE {nombre} PARTITION OF {TABLA} {limites}"))
+    await conn.execute(text(f"INSERT INTO {nombre} SELECT * FROM {DEFAULT} WHERE {_rango(inicio)}"))
+    await conn.execute(text(f"DELETE FROM {DEFAULT} WHERE {_rango(inicio)}"))
+    await conn.execute(text(f"ALTER TABLE {TABLA} ATTACH PARTITION {DEFAULT} DEFAULT"))
+
+async def asegurar_particiones(conn: AsyncConnection, meses: int = PARTICIONES_ADELANTE) -> List[str]:
+    """Crea las particiones que falten si la tabla está particionada; si no, no hace nada."""
+    if not await _es_particionada(conn):
+        return []
+    return await crear_particiones(conn, meses)
+
+async def mantener_particiones(engine, cada: float = PARTICIONES_CADA) -> None:
+    """Tarea de fondo de la app: asegura las particiones de los próximos meses cada `cada` segundos."""
+    while True:
+        try:
+            async with engine.connect() as conn:
+                await asegurar_particiones(conn)
+        except Exception as e:
+            print("⚠ No se pudieron crear las particiones del historial:", e)
+        await asyncio.sleep(cada)
+
+async def migrar_a_particionada(conn: AsyncConnection, meses: int = 3) -> None:
+    """Convierte historial_eliminados en tabla particionada por mes, copiando los datos existentes."""
+    viejo = f"{TABLA}_sin_particion"
+    desde = (await conn.execute(select(func.min(HistorialEliminados.eliminado_en)))).scalar()
+    seq = (await conn.execute(text(f"SELECT pg_get_serial_sequence('{TABLA}', 'id')"))).scalar()
+
+    await conn.execute(text(f"ALTER TABLE {TABLA} RENAME TO {viejo}"))
+    await conn.execute(text(
+        f"CREATE TABLE {TABLA} (LIKE {viejo} INCLUDING DEFAULTS) PARTITION BY RANGE (eliminado_en)"
+    ))
+    # en tablas particionadas la PK debe incluir la clave de partición
+    await conn.execute(text(f"ALTER TABLE {TABLA} ADD PRIMARY KEY (id, eliminado_en)"))
+    await conn.execute(text(
+        f"CREATE INDEX ix_historial_tabla_eliminado_p ON {TABLA} (tabla, eliminado_en, id)"
+    ))
+    await conn.execute(text(f"CREATE INDEX ix_historial_eliminado_p ON {TABLA} (eliminado_en, id)"))
+    if seq:
+        # la secuencia del id pasa a la tabla nueva (si no, se borraría junto con la vieja)
+        await conn.execute(text(f"ALTER SEQUENCE {seq} OWNED BY {TABLA}.id"))
+    await crear_particiones(conn, meses, desde.date() if desde else None, commit=False)
+    await conn.execute(text(f"INSERT INTO {TABLA} SELECT * FROM {viejo}"))
+    await conn.execute(text(f"DROP TABLE {viejo}"))
+    await conn.commit()
+
+async def _main() -> None:
+    from database import dispose_engine, get_engine
+
+    parser = argparse.ArgumentParser(description="Mantenimiento de historial_eliminados")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    a = sub.add_parser("archive")
+    a.add_argument("--dias", type=int, default=RETENCION_DIAS)
+    a.add_argument("--dir", default=ARCHIVO_DIR)
+    p = sub.add_parser("partition")
+    p.add_argument("--meses", type=int, default=PARTICIONES_ADELANTE)
+    p.add_argument("--migrate", action="store_true")
+    args = parser.parse_args()
+
+    async with get_engine().connect() as conn:
+        if args.cmd == "archive":
+            for ruta in await archivar(conn, args.dias, args.dir):
+                print(f"✔ archivado: {ruta}")
+        else:
+            if conn.dialect.name != "postgresql":
+                raise SystemExit("El particionado solo está disponible en PostgreSQL")
+            if not await _es_particionada(conn):
+                if not args.migrate:
+                    raise SystemExit(f"{TABLA} no está particionada (usa --migrate para convertirla)")
+                await migrar_a_particionada(conn, args.meses)
+                print(f"✔ {TABLA} convertida a tabla particionada")
+            for nombre in await crear_particiones(conn, args.meses):
+                print(f"✔ partición: {nombre}")
+    await dispose_engine()
+
+if __name__ == "__main__":
+    asyncio.run(_main())
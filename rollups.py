@@ -0,0 +1,150 @@
+# rollups.py
+# Resúmenes de ventas pre-agregados (tabla resumen_ventas), por día y por mes, para las
+# dimensiones producto, categoría y cliente. Se actualizan en la misma transacción en que
+# se inserta o elimina una Compra (upsert que suma/resta), así los reportes no recorren `compras`.
+#
+# La dimensión "total" no se guarda: una fila por día que tocan todas las compras serializaría
+# los checkouts concurrentes en su bloqueo. Se calcula al leer sumando las filas de categoría
+# (cada venta cae en exactamente una, o en SIN_CLAVE), ver select_total().
+# Las filas se escriben ordenadas por clave, así dos transacciones siempre las bloquean en el
+# mismo orden y no pueden bloquearse en cruz. Los días son días UTC, tanto aquí como en rebuild.
+#
+# Reconstrucción completa (p. ej. tras cargar datos históricos):
+#     python rollups.py rebuild
+from __future__ import annotations
+import asyncio
+import sys
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Select, delete, func, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Compra, ResumenVentas
+
+DIMENSIONES = ("producto", "categoria", "cliente")  # "total" se deriva de "categoria"
+PERIODOS = ("D", "M")  # diario / mensual
+SIN_CLAVE = 0          # clave para "total" y para FKs nulas
+
+# (fecha de la compra, producto_id, categoria_id, cliente_id, unidades, ingresos)
+Venta = Tuple[date, Optional[int], Optional[int], Optional[int], int, float]
+
+def fecha_de(ts) -> date:
+    # SQLite devuelve texto, PostgreSQL datetime con zona: se agrupa por día UTC
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if isinstance(ts, datetime):
+        if ts.tzinfo is not None:
+            ts = ts.astimezone(timezone.utc)
+        return ts.date()
+    return ts
+
+def _agregar(ventas: Iterable[Venta], signo: int) -> Dict[Tuple[str, date, str, int], List[float]]:
+    acc: Dict[Tuple[str, date, str, int], List[float]] = defaultdict(lambda: [0, 0.0, 0])
+    for dia, producto_id, categoria_id, cliente_id, unidades, ingresos, *n in ventas:
+        compras = n[0] if n else 1
+        claves = {
+            "producto": producto_id,
+            "categoria": categoria_id,
+            "cliente": cliente_id,
+        }
+        for periodo in PERIODOS:
+            fecha = dia if periodo == "D" else dia.replace(day=1)
+            for dim, clave in claves.items():
+                a = acc[(periodo, fecha, dim, clave if clave is not None else SIN_CLAVE)]
+                a[0] += signo * unidades
+                a[1] += signo * ingresos
+                a[2] += signo * compras
+    return acc
+
+def _upsert(dialect: str):
+    if dialect == "postgresql":
+        return postgresql.insert(ResumenVentas)
+    if dialect == "sqlite":
+        return sqlite.insert(ResumenVentas)
+    raise NotImplementedError(f"Resúmenes de ventas no soportados en '{dialect}'")
+
+async def registrar_ventas(db: AsyncSession, ventas: Iterable[Venta], signo: int = 1) -> None:
+    """
+    Suma (signo=1) o resta (signo=-1) las ventas en los resúmenes. No hace commit: debe ir en la
+    misma transacción que el INSERT/DELETE de las compras.
+    """
+    acc = _agregar(ventas, signo)
+    if not acc:
+        return
+    stmt = _upsert(db.get_bind().dialect.name)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["periodo", "fecha", "dimension", "clave"],
+        set_={
+            "unidades": ResumenVentas.unidades + stmt.excluded.unidades,
+            "ingresos": ResumenVentas.ingresos + stmt.excluded.ingresos,
+            "compras": ResumenVentas.compras + stmt.excluded.compras,
+        },
+    )
+    await db.execute(stmt, [
+        {"periodo": p, "fecha": f, "dimension": d, "clave": c, "unidades": u, "ingresos": i, "compras": n}
+        for (p, f, d, c), (u, i, n) in sorted(acc.items())  # orden fijo de bloqueo
+    ])
+
+def select_total(periodo: str) -> Select:
+    """Filas de la dimensión "total" (clave SIN_CLAVE) sumando las de categoría de cada fecha."""
+    return (
+        select(
+            ResumenVentas.periodo,
+            ResumenVentas.fecha,
+            literal("total").label("dimension"),
+            literal(SIN_CLAVE).label("clave"),
+            func.sum(ResumenVentas.unidades).label("unidades"),
+            func.sum(ResumenVentas.ingresos).label("ingresos"),
+            func.sum(ResumenVentas.compras).label("compras"),
+        )
+        .where(ResumenVentas.periodo == periodo, ResumenVentas.dimension == "categoria")
+        .group_by(ResumenVentas.periodo, ResumenVentas.fecha)
+    )
+
+def _dia_utc(dialect: str):
+    # mismo día que fecha_de(): PostgreSQL agruparía por la zona horaria de la sesión
+    if dialect == "postgresql":
+        return func.date(func.timezone("UTC", Compra.creado_en))
+    return func.date(Compra.creado_en)  # SQLite: date() ya normaliza a UTC los textos con offset
+
+async def reconstruir(db: AsyncSession) -> int:
+    """Vacía y recalcula los resúmenes desde `compras` con un GROUP BY por día. Devuelve filas escritas."""
+    dia = _dia_utc(db.get_bind().dialect.name)
+    q = await db.stream(
+        select(
+            dia, Compra.producto_id, Compra.categoria_id, Compra.cliente_id,
+            func.sum(Compra.cantidad), func.sum(Compra.total), func.count(),
+        )
+        .group_by(dia, Compra.producto_id, Compra.categoria_id, Compra.cliente_id)
+    )
+    ventas = [
+        (fecha_de(d), pid, cid, clid, int(u or 0), float(i or 0), int(n))
+        async for d, pid, cid, clid, u, i, n in q
+    ]
+    await db.execute(delete(ResumenVentas))
+    acc = _agregar(ventas, 1)
+    filas = [
+        {"periodo": p, "fecha": f, "dimension": d, "clave": c, "unidades": u, "ingresos": i, "compras": n}
+        for (p, f, d, c), (u, i, n) in acc.items()
+    ]
+    for start in range(0, len(filas), 5000):
+        await db.execute(insert(ResumenVentas), filas[start:start + 5000])
+    await db.commit()
+    return len(filas)
+
+async def _main(argv: List[str]) -> None:
+    from database import AsyncSessionLocal, dispose_engine
+
+    if argv[1:] != ["rebuild"]:
+        print("uso: python rollups.py rebuild")
+        sys.exit(2)
+    async with AsyncSessionLocal() as db:
+        n = await reconstruir(db)
+    await dispose_engine()
+    print(f"✔ resumen_ventas reconstruido: {n} filas")
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv))
@@ -1,31 +1,56 @@
 from typing import List, Optional
-from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Response, UploadFile, File, Request
 from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
+from audit import delete_returning, log_deleted_rows
+from cache import catalog_cache
+from bulk_import import import_upload
+from etag import check_etag, respond_etag
+from search import buscar
+from fast_json import FIELDS_DESCRIPTION, parse_fields, fast_path, list_select, list_rows, list_response, encode_rows, json_response
+from pagination import PageParams, paginate_by_id, paginate_by_time, finish_page, NEXT_CURSOR_HEADER
 from models import Categoria, HistorialEliminados
-import schemas 
+import schemas
+from crud import commit_unico
 
 router = APIRouter(prefix="/categorias", tags=["Categorias"])
 
-async def log_delete(db: AsyncSession, tabla: str, registro_id: int, descripcion: str | None = None):
-    h = HistorialEliminados(
-        tabla=tabla,
-        registro_id=registro_id,
-        datos={"descripcion": descripcion or "", "timestamp": datetime.utcnow().isoformat()},
-    )
-    db.add(h)
+def _describir(r) -> str:
+    # descripción legible para el historial
+    return f"Categoría '{r.nombre}' eliminada"
 
 @router.get("/", response_model=List[schemas.CategoriaRead])
 async def listar_categorias(
+    request: Request,
+    response: Response,
     nombre: Optional[str] = Query(None),
     codigo: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(),
     db: AsyncSession = Depends(get_db),
 ):
-    stmt = select(Categoria)
+    campos = parse_fields(fields, schemas.CategoriaRead)
+    key = (nombre, codigo, campos, page.limit, page.cursor)
+    # primero la caché: un acierto (incluido el 304) no toca la base de datos
+    cached = catalog_cache.get("categorias", key)
+    if cached is not None:
+        rows, next_cursor, etag = cached
+        not_modified = respond_etag(request, response, etag)
+        if not_modified:
+            return not_modified
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return json_response(rows, response) if isinstance(rows, bytes) else rows
+
+    generacion = catalog_cache.generation("categorias")  # antes de consultar: ver TTLCache.set
+    not_modified = await check_etag(db, request, response, "categorias", Categoria, Categoria.actualizado_en)
+    if not_modified:
+        return not_modified
+
+    stmt = list_select(Categoria, schemas.CategoriaRead, campos, ("id",))
     conds = []
     if nombre:
         conds.append(Categoria.nombre == nombre)
@@ -33,17 +58,43 @@ async def listar_categorias(
         conds.append(Categoria.codigo == codigo)
     if conds:
         stmt = stmt.where(and_(*conds))
+    stmt = paginate_by_id(stmt, Categoria.id, page)
     res = await db.execute(stmt)
-    return res.scalars().all()
+    rows = finish_page(list_rows(res, campos), page, response, "id")
+    # en caché queda lo ya serializado (JSON en la ruta rápida o proyección, modelos Read en la normal)
+    payload = encode_rows(rows, campos) if fast_path(campos) else [schemas.CategoriaRead.model_validate(o) for o in rows]
+    catalog_cache.set("categorias", key, (payload, response.headers.get(NEXT_CURSOR_HEADER), response.headers["ETag"]), generacion)
+    return json_response(payload, response) if fast_path(campos) else payload
+
+@router.get("/buscar", response_model=List[schemas.CategoriaRead])
+async def buscar_categorias(
+    q: str = Query(..., min_length=1, description="Texto a buscar en el nombre (admite prefijos)"),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+):
+    # índice trigram (PostgreSQL) / FTS5 (SQLite), ordenado por relevancia
+    return await buscar(db, Categoria, q, limit)
 
 @router.post("/", response_model=schemas.CategoriaRead, status_code=status.HTTP_201_CREATED)
 async def crear_categoria(payload: schemas.CategoriaCreate, db: AsyncSession = Depends(get_db)):
     obj = Categoria(**payload.model_dump())
     db.add(obj)
-    await db.commit()
+    await commit_unico(db, {Categoria.nombre: (409, "La categoría ya existe")})
+    catalog_cache.invalidate("categorias")
     await db.refresh(obj)
     return obj
 
+@router.post("/importar", response_model=schemas.ImportResultado)
+async def importar_categorias(
+    archivo: UploadFile = File(..., description="CSV con cabecera o JSON Lines"),
+    formato: Optional[str] = Query(None, description="csv | jsonl (por defecto según la extensión)"),
+    db: AsyncSession = Depends(get_db),
+):
+    # upsert por código; las filas inválidas se reportan sin abortar el resto
+    resultado = await import_upload(db, archivo, formato, schemas.CategoriaCreate, Categoria, key="codigo")
+    catalog_cache.invalidate("categorias")
+    return resultado
+
 @router.put("/{categoria_id}", response_model=schemas.CategoriaRead)
 async def actualizar_categoria(categoria_id: int, payload: schemas.CategoriaUpdate, db: AsyncSession = Depends(get_db)):
     res = await db.execute(select(Categoria).where(Categoria.id == categoria_id))
@@ -52,28 +103,43 @@ async def actualizar_categoria(categoria_id: int, payload: schemas.CategoriaUpda
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
     for k, v in payload.model_dump(exclude_none=True).items():
         setattr(obj, k, v)
-    await db.commit()
+    await commit_unico(db, {Categoria.nombre: (409, "Ya existe otra categoría con ese nombre")})
+    catalog_cache.invalidate("categorias")
     await db.refresh(obj)
     return obj
 
 @router.delete("/{categoria_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def eliminar_categoria(categoria_id: int, db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(Categoria).where(Categoria.id == categoria_id))
-    obj = res.scalar_one_or_none()
-    if not obj:
+    # DELETE ... RETURNING: un viaje y snapshot completo de la fila para el historial
+    rows = await delete_returning(db, Categoria, [categoria_id])
+    if not rows:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
-
-    await log_delete(db, "Categoria", obj.id, f"Categoría '{obj.nombre}' eliminada")
-    await db.delete(obj)
     await db.commit()
+    await log_deleted_rows("Categoria", Categoria, rows, _describir)
+    catalog_cache.invalidate("categorias")
+    catalog_cache.invalidate("productos")  # sus productos quedan sin categoría
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
+@router.post("/eliminar", response_model=schemas.EliminarLoteRead)
+async def eliminar_categorias_lote(payload: schemas.EliminarLote, db: AsyncSession = Depends(get_db)):
+    # borrado masivo por ids en una sola sentencia; los ids inexistentes se ignoran
+    rows = await delete_returning(db, Categoria, payload.ids)
+    await db.commit()
+    await log_deleted_rows("Categoria", Categoria, rows, _describir)
+    catalog_cache.invalidate("categorias")
+    catalog_cache.invalidate("productos")  # sus productos quedan sin categoría
+    return {"eliminados": len(rows), "ids": [r.id for r in rows]}
+
 @router.get("/historial/eliminados", response_model=List[schemas.HistorialEliminadoRead])
-async def historial_categorias_eliminadas(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(
-        select(HistorialEliminados)
-        .where(HistorialEliminados.tabla == "Categoria")
-        .order_by(HistorialEliminados.eliminado_en.desc())
-    )
-    return res.scalars().all()
+async def historial_categorias_eliminadas(
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    campos = parse_fields(fields, schemas.HistorialEliminadoRead)
+    stmt = list_select(HistorialEliminados, schemas.HistorialEliminadoRead, campos, ("eliminado_en", "id")).where(HistorialEliminados.tabla == "Categoria")
+    stmt = paginate_by_time(stmt, HistorialEliminados.eliminado_en, HistorialEliminados.id, page)
+    res = await db.execute(stmt)
+    return list_response(finish_page(list_rows(res, campos), page, response, "eliminado_en", "id"), response, campos)
 
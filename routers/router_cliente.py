@@ -1,32 +1,37 @@
 from typing import List, Optional
-from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Response, UploadFile, File
 from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
+from audit import delete_returning, log_deleted_rows
+from cache import catalog_cache
+from bulk_import import import_upload
+from fast_json import FIELDS_DESCRIPTION, parse_fields, list_select, list_rows, list_response
+from pagination import PageParams, paginate_by_id, paginate_by_time, finish_page
 from models import Cliente, HistorialEliminados
 import schemas
+from crud import commit_unico
 
 router = APIRouter(prefix="/clientes", tags=["Clientes"])
 
-async def log_delete(db: AsyncSession, tabla: str, registro_id: int, descripcion: str | None = None):
-    h = HistorialEliminados(
-        tabla=tabla,
-        registro_id=registro_id,
-        datos={"descripcion": descripcion or "", "timestamp": datetime.utcnow().isoformat()},
-    )
-    db.add(h)
+def _describir(r) -> str:
+    # descripción legible para el historial
+    return f"Cliente '{r.nombre}' eliminado"
 
 @router.get("/", response_model=List[schemas.ClienteRead])
 async def listar_clientes(
+    response: Response,
     nombre: Optional[str] = Query(None),
     cedula: Optional[str] = Query(None),
     tipo_cliente: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(),
     db: AsyncSession = Depends(get_db),
 ):
-    stmt = select(Cliente)
+    campos = parse_fields(fields, schemas.ClienteRead)
+    stmt = list_select(Cliente, schemas.ClienteRead, campos, ("id",))
     conds = []
     if nombre:
         conds.append(Cliente.nombre == nombre)
@@ -36,17 +41,27 @@ async def listar_clientes(
         conds.append(Cliente.tipo_cliente == tipo_cliente)
     if conds:
         stmt = stmt.where(and_(*conds))
+    stmt = paginate_by_id(stmt, Cliente.id, page)
     res = await db.execute(stmt)
-    return res.scalars().all()
+    return list_response(finish_page(list_rows(res, campos), page, response, "id"), response, campos)
 
 @router.post("/", response_model=schemas.ClienteRead, status_code=status.HTTP_201_CREATED)
 async def crear_cliente(payload: schemas.ClienteCreate, db: AsyncSession = Depends(get_db)):
     obj = Cliente(**payload.model_dump())
     db.add(obj)
-    await db.commit()
+    await commit_unico(db, {Cliente.cedula: (409, "Ya existe un cliente con esa cédula")})
     await db.refresh(obj)
     return obj
 
+@router.post("/importar", response_model=schemas.ImportResultado)
+async def importar_clientes(
+    archivo: UploadFile = File(..., description="CSV con cabecera o JSON Lines"),
+    formato: Optional[str] = Query(None, description="csv | jsonl (por defecto según la extensión)"),
+    db: AsyncSession = Depends(get_db),
+):
+    # upsert por cédula; las filas inválidas se reportan sin abortar el resto
+    return await import_upload(db, archivo, formato, schemas.ClienteCreate, Cliente, key="cedula")
+
 @router.put("/{cliente_id}", response_model=schemas.ClienteRead)
 async def actualizar_cliente(cliente_id: int, payload: schemas.ClienteUpdate, db: AsyncSession = Depends(get_db)):
     res = await db.execute(select(Cliente).where(Cliente.id == cliente_id))
@@ -55,27 +70,39 @@ async def actualizar_cliente(cliente_id: int, payload: schemas.ClienteUpdate, db
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
     for k, v in payload.model_dump(exclude_none=True).items():
         setattr(obj, k, v)
-    await db.commit()
+    await commit_unico(db, {Cliente.cedula: (409, "Ya existe otro cliente con esa cédula")})
     await db.refresh(obj)
     return obj
 
 @router.delete("/{cliente_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def eliminar_cliente(cliente_id: int, db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(Cliente).where(Cliente.id == cliente_id))
-    obj = res.scalar_one_or_none()
-    if not obj:
+    # DELETE ... RETURNING: un viaje y snapshot completo de la fila para el historial
+    rows = await delete_returning(db, Cliente, [cliente_id])
+    if not rows:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
-
-    await log_delete(db, "Cliente", obj.id, f"Cliente '{obj.nombre}' eliminado")
-    await db.delete(obj)
     await db.commit()
+    await log_deleted_rows("Cliente", Cliente, rows, _describir)
+    catalog_cache.invalidate("compras")  # sus compras quedan con cliente_id NULL
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
+@router.post("/eliminar", response_model=schemas.EliminarLoteRead)
+async def eliminar_clientes_lote(payload: schemas.EliminarLote, db: AsyncSession = Depends(get_db)):
+    # borrado masivo por ids en una sola sentencia; los ids inexistentes se ignoran
+    rows = await delete_returning(db, Cliente, payload.ids)
+    await db.commit()
+    await log_deleted_rows("Cliente", Cliente, rows, _describir)
+    catalog_cache.invalidate("compras")  # sus compras quedan con cliente_id NULL
+    return {"eliminados": len(rows), "ids": [r.id for r in rows]}
+
 @router.get("/historial/eliminados", response_model=List[schemas.HistorialEliminadoRead])
-async def historial_clientes_eliminados(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(
-        select(HistorialEliminados)
-        .where(HistorialEliminados.tabla == "Cliente")
-        .order_by(HistorialEliminados.eliminado_en.desc())
-    )
-    return res.scalars().all()
+async def historial_clientes_eliminados(
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    campos = parse_fields(fields, schemas.HistorialEliminadoRead)
+    stmt = list_select(HistorialEliminados, schemas.HistorialEliminadoRead, campos, ("eliminado_en", "id")).where(HistorialEliminados.tabla == "Cliente")
+    stmt = paginate_by_time(stmt, HistorialEliminados.eliminado_en, HistorialEliminados.id, page)
+    res = await db.execute(stmt)
+    return list_response(finish_page(list_rows(res, campos), page, response, "eliminado_en", "id"), response, campos)
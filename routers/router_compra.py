@@ -1,56 +1,101 @@
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Response, Request
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
+from audit import delete_returning, log_deleted_rows
+from cache import catalog_cache
+from export import stream_export, apply_date_range
+from etag import check_etag
+from fast_json import FIELDS_DESCRIPTION, parse_fields, list_select, list_rows, list_response
+from pagination import PageParams, paginate_by_time, finish_page
 from models import Compra, HistorialEliminados
+from rollups import registrar_ventas, fecha_de
 import schemas
+import crud
 
 router = APIRouter(prefix="/compras", tags=["Compras"])
 
-async def log_delete(db: AsyncSession, tabla: str, registro_id: int, descripcion: str | None = None):
-    h = HistorialEliminados(
-        tabla=tabla,
-        registro_id=registro_id,
-        datos={"descripcion": descripcion or "", "timestamp": datetime.utcnow().isoformat()},
-    )
-    db.add(h)
-
 @router.get("/", response_model=List[schemas.CompraRead])
-async def listar_compras(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(Compra))
-    return res.scalars().all()
+async def listar_compras(
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    campos = parse_fields(fields, schemas.CompraRead)
+    not_modified = await check_etag(db, request, response, "compras", Compra, Compra.creado_en)
+    if not_modified:
+        return not_modified
+
+    stmt = paginate_by_time(list_select(Compra, schemas.CompraRead, campos, ("creado_en", "id")), Compra.creado_en, Compra.id, page)
+    res = await db.execute(stmt)
+    return list_response(finish_page(list_rows(res, campos), page, response, "creado_en", "id"), response, campos)
+
+@router.get("/export")
+async def exportar_compras(
+    formato: str = Query("ndjson", description="ndjson | csv"),
+    desde: Optional[datetime] = Query(None, description="creado_en >= desde"),
+    hasta: Optional[datetime] = Query(None, description="creado_en < hasta"),
+):
+    stmt = select(*Compra.__table__.c)
+    stmt = apply_date_range(stmt, Compra.creado_en, desde, hasta)
+    stmt = stmt.order_by(Compra.creado_en, Compra.id)
+    return await stream_export(stmt, formato, "compras")
 
 @router.post("/", response_model=schemas.CompraRead, status_code=status.HTTP_201_CREATED)
 async def crear_compra(payload: schemas.CompraCreate, db: AsyncSession = Depends(get_db)):
-    obj = Compra(**payload.model_dump())
-    db.add(obj)
+    # valida y descuenta stock en un solo UPDATE condicional (ver crud.crear_compra)
+    compra = await crud.crear_compra(db, payload)
+    catalog_cache.invalidate("productos")  # cambió el stock
+    return compra
+
+@router.post("/pedido", response_model=schemas.PedidoRead, status_code=status.HTTP_201_CREATED)
+async def crear_pedido(payload: schemas.PedidoCreate, db: AsyncSession = Depends(get_db)):
+    # todas las líneas en una transacción: un IN para validar, un executemany para insertar
+    compras, total = await crud.crear_pedido(db, payload)
+    catalog_cache.invalidate("productos")  # cambió el stock
+    return {"cliente_id": payload.cliente_id, "total": float(total), "compras": compras}
+
+async def _eliminar_compras(db: AsyncSession, ids: List[int]):
+    # DELETE ... RETURNING; se descuenta de la categoría guardada en la compra (la de la venta)
+    rows = await delete_returning(db, Compra, ids)
+    await registrar_ventas(db, [
+        (fecha_de(r.creado_en), r.producto_id, r.categoria_id, r.cliente_id, r.cantidad, r.total) for r in rows
+    ], signo=-1)
     await db.commit()
-    await db.refresh(obj)
-    return obj
+    catalog_cache.invalidate("compras")  # nueva versión para el ETag de /compras
+    await log_deleted_rows("Compra", Compra, rows, lambda r: "Compra eliminada")
+    return rows
 
 @router.delete("/{compra_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def eliminar_compra(compra_id: int, db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(Compra).where(Compra.id == compra_id))
-    obj = res.scalar_one_or_none()
-    if not obj:
+    rows = await _eliminar_compras(db, [compra_id])
+    if not rows:
         raise HTTPException(status_code=404, detail="Compra no encontrada")
-
-    await log_delete(db, "Compra", obj.id, "Compra eliminada")
-    await db.delete(obj)
-    await db.commit()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
+@router.post("/eliminar", response_model=schemas.EliminarLoteRead)
+async def eliminar_compras_lote(payload: schemas.EliminarLote, db: AsyncSession = Depends(get_db)):
+    # borrado masivo por ids en una sola sentencia; los ids inexistentes se ignoran
+    rows = await _eliminar_compras(db, payload.ids)
+    return {"eliminados": len(rows), "ids": [r.id for r in rows]}
+
 @router.get("/historial/eliminados", response_model=List[schemas.HistorialEliminadoRead])
-async def historial_compras_eliminadas(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(
-        select(HistorialEliminados)
-        .where(HistorialEliminados.tabla == "Compra")
-        .order_by(HistorialEliminados.eliminado_en.desc())
-    )
-    return res.scalars().all()
+async def historial_compras_eliminadas(
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    campos = parse_fields(fields, schemas.HistorialEliminadoRead)
+    stmt = list_select(HistorialEliminados, schemas.HistorialEliminadoRead, campos, ("eliminado_en", "id")).where(HistorialEliminados.tabla == "Compra")
+    stmt = paginate_by_time(stmt, HistorialEliminados.eliminado_en, HistorialEliminados.id, page)
+    res = await db.execute(stmt)
+    return list_response(finish_page(list_rows(res, campos), page, response, "eliminado_en", "id"), response, campos)
 
 
@@ -1,20 +1,48 @@
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Response, Request
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
+from export import stream_export, apply_date_range
+from etag import check_etag
+from fast_json import FIELDS_DESCRIPTION, parse_fields, list_select, list_rows, list_response
+from pagination import PageParams, paginate_by_time, finish_page
 from models import HistorialEliminados
 import schemas
 
 router = APIRouter(prefix="/historial", tags=["Historial"])
 
 @router.get("/eliminados", response_model=List[schemas.HistorialEliminadoRead])
-async def listar_eliminados(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(
-        select(HistorialEliminados).order_by(HistorialEliminados.eliminado_en.desc())
-    )
-    return res.scalars().all()
+async def listar_eliminados(
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    campos = parse_fields(fields, schemas.HistorialEliminadoRead)
+    not_modified = await check_etag(db, request, response, "historial", HistorialEliminados, HistorialEliminados.eliminado_en)
+    if not_modified:
+        return not_modified
 
+    stmt = list_select(HistorialEliminados, schemas.HistorialEliminadoRead, campos, ("eliminado_en", "id"))
+    stmt = paginate_by_time(stmt, HistorialEliminados.eliminado_en, HistorialEliminados.id, page)
+    res = await db.execute(stmt)
+    return list_response(finish_page(list_rows(res, campos), page, response, "eliminado_en", "id"), response, campos)
 
+@router.get("/export")
+async def exportar_eliminados(
+    formato: str = Query("ndjson", description="ndjson | csv"),
+    tabla: Optional[str] = Query(None, description="Producto, Cliente, Compra, ..."),
+    desde: Optional[datetime] = Query(None, description="eliminado_en >= desde"),
+    hasta: Optional[datetime] = Query(None, description="eliminado_en < hasta"),
+):
+    stmt = select(*HistorialEliminados.__table__.c)
+    if tabla:
+        stmt = stmt.where(HistorialEliminados.tabla == tabla)
+    stmt = apply_date_range(stmt, HistorialEliminados.eliminado_en, desde, hasta)
+    stmt = stmt.order_by(HistorialEliminados.eliminado_en, HistorialEliminados.id)
+    return await stream_export(stmt, formato, "historial_eliminados")
@@ -1,31 +1,56 @@
 from typing import List, Optional
-from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Response, UploadFile, File, Request
 from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_db
+from database import get_db, get_primary_db
+from audit import delete_returning, log_deleted_rows
+from cache import catalog_cache
+from bulk_import import import_upload
+from etag import check_etag, respond_etag
+from search import buscar
+from fast_json import FIELDS_DESCRIPTION, parse_fields, fast_path, list_select, list_rows, list_response, encode_rows, json_response
+from pagination import PageParams, paginate_by_id, paginate_by_time, finish_page, NEXT_CURSOR_HEADER
 from models import Producto, HistorialEliminados
 import schemas
+import crud
 
 router = APIRouter(prefix="/productos", tags=["Productos"])
 
-async def log_delete(db: AsyncSession, tabla: str, registro_id: int, descripcion: str | None = None):
-    h = HistorialEliminados(
-        tabla=tabla,
-        registro_id=registro_id,
-        datos={"descripcion": descripcion or "", "timestamp": datetime.utcnow().isoformat()},
-    )
-    db.add(h)
+def _describir(r) -> str:
+    # descripción legible para el historial
+    return f"Producto '{r.nombre}' eliminado"
 
 @router.get("/", response_model=List[schemas.ProductoRead])
 async def listar_productos(
+    request: Request,
+    response: Response,
     nombre: Optional[str] = Query(None),
     categoria_id: Optional[int] = Query(None),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(),
     db: AsyncSession = Depends(get_db),
 ):
-    stmt = select(Producto)
+    campos = parse_fields(fields, schemas.ProductoRead)
+    key = (nombre, categoria_id, campos, page.limit, page.cursor)
+    # primero la caché: un acierto (incluido el 304) no toca la base de datos
+    cached = catalog_cache.get("productos", key)
+    if cached is not None:
+        rows, next_cursor, etag = cached
+        not_modified = respond_etag(request, response, etag)
+        if not_modified:
+            return not_modified
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return json_response(rows, response) if isinstance(rows, bytes) else rows
+
+    generacion = catalog_cache.generation("productos")  # antes de consultar: ver TTLCache.set
+    not_modified = await check_etag(db, request, response, "productos", Producto, Producto.actualizado_en)
+    if not_modified:
+        return not_modified
+
+    stmt = list_select(Producto, schemas.ProductoRead, campos, ("id",))
     conds = []
     if nombre:
         conds.append(Producto.nombre == nombre)
@@ -33,17 +58,63 @@ async def listar_productos(
         conds.append(Producto.categoria_id == categoria_id)
     if conds:
         stmt = stmt.where(and_(*conds))
+    stmt = paginate_by_id(stmt, Producto.id, page)
+    res = await db.execute(stmt)
+    rows = finish_page(list_rows(res, campos), page, response, "id")
+    # en caché queda lo ya serializado (JSON en la ruta rápida o proyección, modelos Read en la normal)
+    payload = encode_rows(rows, campos) if fast_path(campos) else [schemas.ProductoRead.model_validate(o) for o in rows]
+    catalog_cache.set("productos", key, (payload, response.headers.get(NEXT_CURSOR_HEADER), response.headers["ETag"]), generacion)
+    return json_response(payload, response) if fast_path(campos) else payload
+
+@router.get("/bajo-stock", response_model=List[schemas.ProductoRead])
+async def productos_bajo_stock(
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_primary_db),  # reposición: siempre el stock actual, no la réplica
+):
+    # cantidad <= stock_minimo, servido por el índice parcial ix_productos_bajo_stock
+    campos = parse_fields(fields, schemas.ProductoRead)
+    stmt = list_select(Producto, schemas.ProductoRead, campos, ("id",)).where(Producto.cantidad <= Producto.stock_minimo)
+    stmt = paginate_by_id(stmt, Producto.id, page)
     res = await db.execute(stmt)
-    return res.scalars().all()
+    return list_response(finish_page(list_rows(res, campos), page, response, "id"), response, campos)
+
+@router.get("/buscar", response_model=List[schemas.ProductoRead])
+async def buscar_productos(
+    q: str = Query(..., min_length=1, description="Texto a buscar en el nombre (admite prefijos)"),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+):
+    # índice trigram (PostgreSQL) / FTS5 (SQLite), ordenado por relevancia
+    return await buscar(db, Producto, q, limit)
 
 @router.post("/", response_model=schemas.ProductoRead, status_code=status.HTTP_201_CREATED)
 async def crear_producto(payload: schemas.ProductoCreate, db: AsyncSession = Depends(get_db)):
     obj = Producto(**payload.model_dump())
     db.add(obj)
     await db.commit()
+    catalog_cache.invalidate("productos")
     await db.refresh(obj)
     return obj
 
+@router.post("/cotizar", response_model=schemas.CotizacionRead)
+async def cotizar(payload: schemas.CotizacionCreate, db: AsyncSession = Depends(get_db)):
+    # una sola consulta para toda la canasta (ver crud.cotizar)
+    lineas, total = await crud.cotizar(db, payload.lineas)
+    return {"lineas": lineas, "total": total}
+
+@router.post("/importar", response_model=schemas.ImportResultado)
+async def importar_productos(
+    archivo: UploadFile = File(..., description="CSV con cabecera o JSON Lines"),
+    formato: Optional[str] = Query(None, description="csv | jsonl (por defecto según la extensión)"),
+    db: AsyncSession = Depends(get_db),
+):
+    # sin clave única: siempre inserta; las filas inválidas se reportan sin abortar el resto
+    resultado = await import_upload(db, archivo, formato, schemas.ProductoCreate, Producto)
+    catalog_cache.invalidate("productos")
+    return resultado
+
 @router.put("/{producto_id}", response_model=schemas.ProductoRead)
 async def actualizar_producto(producto_id: int, payload: schemas.ProductoUpdate, db: AsyncSession = Depends(get_db)):
     res = await db.execute(select(Producto).where(Producto.id == producto_id))
@@ -53,27 +124,42 @@ async def actualizar_producto(producto_id: int, payload: schemas.ProductoUpdate,
     for k, v in payload.model_dump(exclude_none=True).items():
         setattr(obj, k, v)
     await db.commit()
+    catalog_cache.invalidate("productos")
     await db.refresh(obj)
     return obj
 
 @router.delete("/{producto_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def eliminar_producto(producto_id: int, db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(Producto).where(Producto.id == producto_id))
-    obj = res.scalar_one_or_none()
-    if not obj:
+    # DELETE ... RETURNING: un viaje y snapshot completo de la fila para el historial
+    rows = await delete_returning(db, Producto, [producto_id])
+    if not rows:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-
-    await log_delete(db, "Producto", obj.id, f"Producto '{obj.nombre}' eliminado")
-    await db.delete(obj)
     await db.commit()
+    await log_deleted_rows("Producto", Producto, rows, _describir)
+    catalog_cache.invalidate("productos")
+    catalog_cache.invalidate("compras")  # sus compras quedan con producto_id NULL
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
+@router.post("/eliminar", response_model=schemas.EliminarLoteRead)
+async def eliminar_productos_lote(payload: schemas.EliminarLote, db: AsyncSession = Depends(get_db)):
+    # borrado masivo por ids en una sola sentencia; los ids inexistentes se ignoran
+    rows = await delete_returning(db, Producto, payload.ids)
+    await db.commit()
+    await log_deleted_rows("Producto", Producto, rows, _describir)
+    catalog_cache.invalidate("productos")
+    catalog_cache.invalidate("compras")  # sus compras quedan con producto_id NULL
+    return {"eliminados": len(rows), "ids": [r.id for r in rows]}
+
 @router.get("/historial/eliminados", response_model=List[schemas.HistorialEliminadoRead])
-async def historial_productos_eliminados(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(
-        select(HistorialEliminados)
-        .where(HistorialEliminados.tabla == "Producto")
-        .order_by(HistorialEliminados.eliminado_en.desc())
-    )
-    return res.scalars().all()
+async def historial_productos_eliminados(
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    campos = parse_fields(fields, schemas.HistorialEliminadoRead)
+    stmt = list_select(HistorialEliminados, schemas.HistorialEliminadoRead, campos, ("eliminado_en", "id")).where(HistorialEliminados.tabla == "Producto")
+    stmt = paginate_by_time(stmt, HistorialEliminados.eliminado_en, HistorialEliminados.id, page)
+    res = await db.execute(stmt)
+    return list_response(finish_page(list_rows(res, campos), page, response, "eliminado_en", "id"), response, campos)
 
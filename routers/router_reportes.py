@@ -0,0 +1,60 @@
+from typing import List, Optional
+from datetime import date, datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_db
+from models import ResumenVentas
+from pagination import PageParams, paginate_by_date, finish_page
+from rollups import SIN_CLAVE, select_total
+import schemas
+
+router = APIRouter(prefix="/reportes", tags=["Reportes"])
+
+PERIODOS = {"dia": "D", "mes": "M"}
+
+def _desde_por_defecto(periodo: str, hasta: date) -> date:
+    # sin rango explícito: últimos 31 días, o los últimos 12 meses (desde el día 1)
+    if periodo == "dia":
+        return hasta - timedelta(days=30)
+    anio, mes = divmod(hasta.year * 12 + hasta.month - 1 - 11, 12)
+    return date(anio, mes + 1, 1)
+
+@router.get("/ventas", response_model=List[schemas.ResumenVentaRead])
+async def reporte_ventas(
+    response: Response,
+    periodo: str = Query("dia", pattern="^(dia|mes)$"),
+    dimension: str = Query("total", pattern="^(producto|categoria|cliente|total)$"),
+    clave: Optional[int] = Query(None, description="id de producto/categoría/cliente"),
+    desde: Optional[date] = Query(None, description="fecha >= desde (por defecto: 31 días / 12 meses antes de hasta)"),
+    hasta: Optional[date] = Query(None, description="fecha <= hasta (por defecto: hoy, UTC)"),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    # lee de resumen_ventas (pre-agregado en rollups.py), nunca de compras;
+    # lo más reciente primero, paginado con X-Next-Cursor como los demás listados
+    if hasta is None:
+        hasta = datetime.now(timezone.utc).date()
+    if desde is None:
+        desde = _desde_por_defecto(periodo, hasta)
+    if dimension == "total":
+        # no se guarda: suma de las filas de categoría del mismo periodo/fecha (una por fecha)
+        if clave not in (None, SIN_CLAVE):
+            return []
+        stmt = select_total(PERIODOS[periodo])
+        clave_col = None
+    else:
+        stmt = select(ResumenVentas).where(
+            ResumenVentas.periodo == PERIODOS[periodo],
+            ResumenVentas.dimension == dimension,
+        )
+        if clave is not None:
+            stmt = stmt.where(ResumenVentas.clave == clave)
+        clave_col = ResumenVentas.clave
+    stmt = stmt.where(ResumenVentas.fecha >= desde, ResumenVentas.fecha <= hasta)
+    res = await db.execute(paginate_by_date(stmt, ResumenVentas.fecha, clave_col, page))
+    if clave_col is None:
+        return finish_page(res.all(), page, response, "fecha")
+    return finish_page(res.scalars().all(), page, response, "fecha", "clave")
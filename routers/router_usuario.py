@@ -1,33 +1,36 @@
 from typing import List, Optional
-from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status, Response
 from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
+from audit import delete_returning, log_deleted_rows
+from fast_json import FIELDS_DESCRIPTION, parse_fields, list_select, list_rows, list_response, item_response
+from pagination import PageParams, paginate_by_id, paginate_by_time, finish_page
 from models import Usuario, HistorialEliminados
 import schemas
+from crud import commit_unico
+from passwords import hash_password, verify_password, verify_dummy
 
 router = APIRouter(prefix="/usuarios", tags=["Usuarios"])
 
-# Helper historial
-async def log_delete(db: AsyncSession, tabla: str, registro_id: int, descripcion: str | None = None):
-    h = HistorialEliminados(
-        tabla=tabla,
-        registro_id=registro_id,
-        datos={"descripcion": descripcion or "", "timestamp": datetime.utcnow().isoformat()},
-    )
-    db.add(h)
+def _describir(r) -> str:
+    # descripción legible para el historial
+    return f"Usuario {r.nombre} eliminado"
 
 @router.get("/", response_model=List[schemas.UsuarioRead])
 async def listar_usuarios(
+    response: Response,
     rol: Optional[str] = Query(None, description="administrador/cliente"),
     cedula: Optional[str] = Query(None),
     correo: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(),
     db: AsyncSession = Depends(get_db),
 ):
-    stmt = select(Usuario)
+    campos = parse_fields(fields, schemas.UsuarioRead)
+    stmt = list_select(Usuario, schemas.UsuarioRead, campos, ("id",))
     conds = []
     if rol:
         conds.append(Usuario.rol == rol)
@@ -37,11 +40,24 @@ async def listar_usuarios(
         conds.append(Usuario.correo == correo)
     if conds:
         stmt = stmt.where(and_(*conds))
+    stmt = paginate_by_id(stmt, Usuario.id, page)
     res = await db.execute(stmt)
-    return res.scalars().all()
+    return list_response(finish_page(list_rows(res, campos), page, response, "id"), response, campos)
 
 @router.get("/{usuario_id}", response_model=schemas.UsuarioRead)
-async def obtener_usuario(usuario_id: int, db: AsyncSession = Depends(get_db)):
+async def obtener_usuario(
+    usuario_id: int,
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    db: AsyncSession = Depends(get_db),
+):
+    campos = parse_fields(fields, schemas.UsuarioRead)
+    if campos is not None:
+        res = await db.execute(list_select(Usuario, schemas.UsuarioRead, campos).where(Usuario.id == usuario_id))
+        row = res.first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        return item_response(row, response, campos)
     res = await db.execute(select(Usuario).where(Usuario.id == usuario_id))
     obj = res.scalar_one_or_none()
     if not obj:
@@ -50,17 +66,15 @@ async def obtener_usuario(usuario_id: int, db: AsyncSession = Depends(get_db)):
 
 @router.post("/", response_model=schemas.UsuarioRead, status_code=status.HTTP_201_CREATED)
 async def crear_usuario(payload: schemas.UsuarioCreate, db: AsyncSession = Depends(get_db)):
-    # correo único
-    if (await db.execute(select(Usuario).where(Usuario.correo == payload.correo))).scalar_one_or_none():
-        raise HTTPException(status_code=409, detail="Correo ya registrado")
-    # cédula única (si viene)
-    if payload.cedula is not None:
-        if (await db.execute(select(Usuario).where(Usuario.cedula == payload.cedula))).scalar_one_or_none():
-            raise HTTPException(status_code=409, detail="Cédula ya registrada")
-
-    obj = Usuario(**payload.model_dump())
+    data = payload.model_dump()
+    data["contraseña"] = await hash_password(data["contraseña"])  # scrypt en el pool de hashing
+    obj = Usuario(**data)
     db.add(obj)
-    await db.commit()
+    # correo/cédula únicos: los garantiza la BD, sin SELECT previo
+    await commit_unico(db, {
+        Usuario.correo: (409, "Correo ya registrado"),
+        Usuario.cedula: (409, "Cédula ya registrada"),
+    })
     await db.refresh(obj)
     return obj
 
@@ -72,40 +86,63 @@ async def actualizar_usuario(usuario_id: int, payload: schemas.UsuarioUpdate, db
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
     data = payload.model_dump(exclude_none=True)
-
-    if "correo" in data:
-        q = await db.execute(select(Usuario).where(Usuario.correo == data["correo"], Usuario.id != usuario_id))
-        if q.scalar_one_or_none():
-            raise HTTPException(status_code=409, detail="Ya existe otro usuario con ese correo")
-    if "cedula" in data:
-        q = await db.execute(select(Usuario).where(Usuario.cedula == data["cedula"], Usuario.id != usuario_id))
-        if q.scalar_one_or_none():
-            raise HTTPException(status_code=409, detail="Ya existe otro usuario con esa cédula")
+    if "contraseña" in data:
+        data["contraseña"] = await hash_password(data["contraseña"])
 
     for k, v in data.items():
         setattr(obj, k, v)
 
-    await db.commit()
+    await commit_unico(db, {
+        Usuario.correo: (409, "Ya existe otro usuario con ese correo"),
+        Usuario.cedula: (409, "Ya existe otro usuario con esa cédula"),
+    })
     await db.refresh(obj)
     return obj
 
-@router.delete("/{usuario_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def borrar_usuario(usuario_id: int, db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(Usuario).where(Usuario.id == usuario_id))
+@router.post("/login", response_model=schemas.UsuarioRead)
+async def login(payload: schemas.UsuarioLogin, db: AsyncSession = Depends(get_db)):
+    res = await db.execute(select(Usuario).where(Usuario.correo == payload.correo))
     obj = res.scalar_one_or_none()
     if not obj:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        await verify_dummy(payload.contraseña)  # mismo tiempo de respuesta que con correo válido
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
+
+    ok, nuevo_hash = await verify_password(payload.contraseña, obj.contraseña)
+    if not ok:
+        raise HTTPException(status_code=401, detail="Credenciales inválidas")
+    if nuevo_hash:
+        # parámetros de scrypt cambiados o contraseña antigua en claro: se re-hashea al vuelo
+        obj.contraseña = nuevo_hash
+        await db.commit()
+    return obj
 
-    await log_delete(db, "Usuario", obj.id, f"Usuario {obj.nombre} eliminado")
-    await db.delete(obj)
+@router.delete("/{usuario_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def borrar_usuario(usuario_id: int, db: AsyncSession = Depends(get_db)):
+    # DELETE ... RETURNING: un viaje y snapshot completo de la fila para el historial
+    rows = await delete_returning(db, Usuario, [usuario_id])
+    if not rows:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
     await db.commit()
+    await log_deleted_rows("Usuario", Usuario, rows, _describir)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
+@router.post("/eliminar", response_model=schemas.EliminarLoteRead)
+async def borrar_usuarios_lote(payload: schemas.EliminarLote, db: AsyncSession = Depends(get_db)):
+    # borrado masivo por ids en una sola sentencia; los ids inexistentes se ignoran
+    rows = await delete_returning(db, Usuario, payload.ids)
+    await db.commit()
+    await log_deleted_rows("Usuario", Usuario, rows, _describir)
+    return {"eliminados": len(rows), "ids": [r.id for r in rows]}
+
 @router.get("/historial/eliminados", response_model=List[schemas.HistorialEliminadoRead])
-async def historial_usuarios_eliminados(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(
-        select(HistorialEliminados)
-        .where(HistorialEliminados.tabla == "Usuario")
-        .order_by(HistorialEliminados.eliminado_en.desc())
-    )
-    return res.scalars().all()
+async def historial_usuarios_eliminados(
+    response: Response,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    campos = parse_fields(fields, schemas.HistorialEliminadoRead)
+    stmt = list_select(HistorialEliminados, schemas.HistorialEliminadoRead, campos, ("eliminado_en", "id")).where(HistorialEliminados.tabla == "Usuario")
+    stmt = paginate_by_time(stmt, HistorialEliminados.eliminado_en, HistorialEliminados.id, page)
+    res = await db.execute(stmt)
+    return list_response(finish_page(list_rows(res, campos), page, response, "eliminado_en", "id"), response, campos)
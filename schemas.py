@@ -1,7 +1,8 @@
 # schemas.py (Pydantic v2)
-from pydantic import BaseModel, EmailStr, ConfigDict
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, ConfigDict, Field
+from typing import List, Optional
+from datetime import date, datetime
+from decimal import Decimal
 
 # ---------------- USUARIO ----------------
 class UsuarioBase(BaseModel):
@@ -27,6 +28,10 @@ class UsuarioRead(UsuarioBase):
     creado_en: datetime
     model_config = ConfigDict(from_attributes=True)
 
+class UsuarioLogin(BaseModel):
+    correo: EmailStr
+    contraseña: str
+
 # ---------------- CLIENTE ----------------
 class ClienteBase(BaseModel):
     nombre: str
@@ -73,6 +78,7 @@ class ProductoBase(BaseModel):
     nombre: str
     descripcion: Optional[str] = None
     cantidad: int
+    stock_minimo: int = 0              # umbral de reposición
     valor_unitario: float
     valor_mayorista: Optional[float] = None
     categoria_id: Optional[int] = None
@@ -84,6 +90,7 @@ class ProductoUpdate(BaseModel):
     nombre: Optional[str] = None
     descripcion: Optional[str] = None
     cantidad: Optional[int] = None
+    stock_minimo: Optional[int] = None
     valor_unitario: Optional[float] = None
     valor_mayorista: Optional[float] = None
     categoria_id: Optional[int] = None
@@ -105,9 +112,71 @@ class CompraCreate(CompraBase):
 
 class CompraRead(CompraBase):
     id: int
+    cliente_id: Optional[int]   # NULL si se eliminó el cliente
+    producto_id: Optional[int]  # NULL si se eliminó el producto
     creado_en: datetime
     model_config = ConfigDict(from_attributes=True)
 
+# ---------------- PEDIDO (varias compras) ----------------
+class PedidoLinea(BaseModel):
+    producto_id: int
+    cantidad: int
+
+class PedidoCreate(BaseModel):
+    cliente_id: int
+    lineas: List[PedidoLinea]
+
+class PedidoRead(BaseModel):
+    cliente_id: int
+    total: float                   # suma de las líneas, precio calculado en servidor
+    compras: List[CompraRead]
+
+# ---------------- COTIZACIÓN ----------------
+class CotizacionCreate(BaseModel):
+    lineas: List[PedidoLinea]
+
+class CotizacionLineaRead(BaseModel):
+    producto_id: int
+    cantidad: int
+    precio_unitario: Decimal       # precio aplicado (minorista o mayorista)
+    mayorista: bool
+    total: Decimal                 # redondeado a 2 decimales
+
+class CotizacionRead(BaseModel):
+    lineas: List[CotizacionLineaRead]
+    total: Decimal
+
+# ---------------- REPORTES ----------------
+class ResumenVentaRead(BaseModel):
+    periodo: str                   # "D" diario / "M" mensual
+    fecha: date
+    dimension: str                 # producto / categoria / cliente / total
+    clave: int
+    unidades: int
+    ingresos: float
+    compras: int
+    model_config = ConfigDict(from_attributes=True)
+
+# ---------------- IMPORTACIÓN MASIVA ----------------
+class ImportErrorFila(BaseModel):
+    fila: int                      # número de línea en el archivo subido
+    error: str
+
+class ImportResultado(BaseModel):
+    procesadas: int
+    insertadas: int
+    actualizadas: int
+    errores_total: int
+    errores: List[ImportErrorFila]  # recortado a los primeros 1000
+
+# ---------------- ELIMINACIÓN EN LOTE ----------------
+class EliminarLote(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=10000)
+
+class EliminarLoteRead(BaseModel):
+    eliminados: int
+    ids: List[int]                 # ids que existían y se borraron
+
 # ---------------- HISTORIAL ----------------
 class HistorialEliminadoRead(BaseModel):
     id: int
@@ -0,0 +1,87 @@
+# search.py
+# Búsqueda por nombre de productos y categorías con índice:
+#  - PostgreSQL: extensión pg_trgm + índice GIN (gin_trgm_ops); sirve tanto para el operador de
+#    similitud `%` como para ILIKE 'texto%', y ordena por similarity().
+#  - SQLite (aiosqlite): tabla virtual FTS5 sincronizada con triggers, orden por bm25().
+# setup_search() es idempotente y se ejecuta al arrancar (ver main.py).
+from __future__ import annotations
+from typing import List
+
+from sqlalchemy import func, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from models import Categoria, Producto
+
+# tabla -> modelo; solo se indexa la columna nombre
+SEARCHABLE = {"productos": Producto, "categorias": Categoria}
+
+async def setup_search(conn: AsyncConnection) -> None:
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for tabla in SEARCHABLE:
+            await conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{tabla}_nombre_trgm "
+                f"ON {tabla} USING gin (nombre gin_trgm_ops)"
+            ))
+    elif dialect == "sqlite":
+        for tabla in SEARCHABLE:
+            existe = (await conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"), {"n": f"{tabla}_fts"}
+            )).first()
+            if existe:
+                continue
+            await conn.execute(text(
+                f"CREATE VIRTUAL TABLE {tabla}_fts USING fts5("
+                f"nombre, content='{tabla}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            ))
+            await conn.execute(text(
+                f"CREATE TRIGGER {tabla}_fts_ai AFTER INSERT ON {tabla} BEGIN "
+                f"INSERT INTO {tabla}_fts(rowid, nombre) VALUES (new.id, new.nombre); END"
+            ))
+            await conn.execute(text(
+                f"CREATE TRIGGER {tabla}_fts_ad AFTER DELETE ON {tabla} BEGIN "
+                f"INSERT INTO {tabla}_fts({tabla}_fts, rowid, nombre) VALUES ('delete', old.id, old.nombre); END"
+            ))
+            await conn.execute(text(
+                f"CREATE TRIGGER {tabla}_fts_au AFTER UPDATE OF nombre ON {tabla} BEGIN "
+                f"INSERT INTO {tabla}_fts({tabla}_fts, rowid, nombre) VALUES ('delete', old.id, old.nombre); "
+                f"INSERT INTO {tabla}_fts(rowid, nombre) VALUES (new.id, new.nombre); END"
+            ))
+            await conn.execute(text(f"INSERT INTO {tabla}_fts({tabla}_fts) VALUES ('rebuild')"))
+
+def _fts_query(q: str) -> str:
+    # cada palabra como prefijo: "lapi" "azu" -> "lapi"* AND "azu"*
+    tokens = [t.replace('"', '""') for t in q.split()]
+    return " ".join(f'"{t}"*' for t in tokens)
+
+def _escape_like(q: str) -> str:
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+async def buscar(db: AsyncSession, model, q: str, limit: int = 20) -> List:
+    """Devuelve hasta `limit` filas de `model` cuyo nombre se parece a `q`, las más relevantes primero."""
+    q = q.strip()
+    if not q:
+        return []
+    tabla = model.__tablename__
+    dialect = db.get_bind().dialect.name
+    prefix = _escape_like(q) + "%"
+
+    if dialect == "postgresql":
+        es_prefijo = model.nombre.ilike(prefix, escape="\\")
+        stmt = (
+            select(model)
+            .where(or_(model.nombre.op("%")(q), es_prefijo))
+            .order_by(es_prefijo.desc(), func.similarity(model.nombre, q).desc(), model.id)
+            .limit(limit)
+        )
+    elif dialect == "sqlite":
+        stmt = select(model).from_statement(text(
+            f"SELECT {tabla}.* FROM {tabla}_fts JOIN {tabla} ON {tabla}.id = {tabla}_fts.rowid "
+            f"WHERE {tabla}_fts MATCH :m ORDER BY bm25({tabla}_fts), {tabla}.id LIMIT :n"
+        ).bindparams(m=_fts_query(q), n=limit))
+    else:
+        stmt = select(model).where(model.nombre.ilike(prefix, escape="\\")).order_by(model.nombre).limit(limit)
+
+    res = await db.execute(stmt)
+    return list(res.scalars().all())